@@ -1,9 +1,24 @@
+import argparse
 import asyncio
-from dataclasses import dataclass
+import collections
+import copy
+from dataclasses import dataclass, field
+import gzip
+import heapq
+import ipaddress
+import itertools
+import json
+import mmap
 import os
+import random
 import re
+import socket
+import struct
+import sys
 import time
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterable, Iterator, List, Optional, Set, TextIO, Tuple
+
+import numpy as np
 
 # Import configuration
 try:
@@ -22,33 +37,80 @@ except ImportError:
         "ping_max_workers": 50,  # asynchronous concurrency limit
         "good_enough_threshold": 50.0,  # latency threshold (milliseconds)
         "max_workers": None,  # CPU cores (None for default)
+        "dns_discovery": False,  # resolve service domains for new candidate IPs
+        "dns_resolvers": ["223.5.5.5", "119.29.29.29", "8.8.8.8", "1.1.1.1"],
+        "dns_ecs_subnets": [None],  # EDNS client subnets (None sends no ECS option)
+        "dns_timeout": 2.0,  # DNS query timeout (seconds)
+        "dns_socket_pool_size": 4,  # UDP sockets used to pipeline queries
+        "dns_write_mode": "sidecar",  # 'sidecar' or 'inplace'
+        "candidate_index_file": None,  # compiled candidate index (None: in data_directory)
+        "shortlist_size": 5,  # top candidates kept per service for later stages
+        "node_name": None,  # node label in snapshots (None for the hostname)
+        "site": "default",  # site label in snapshots
+        "snapshot_export": None,  # write a measurement snapshot to this path
+        "seed_snapshot": None,  # probe only the top candidates of this snapshot
+        "seed_top_n": 20,  # candidates per service taken from the seed snapshot
+        "services": None,  # dynamic services to test (None for all)
+        "profiles": [],  # output profiles evaluated by the 'batch' command
+        "trace_file": None,  # write a Chrome/Perfetto trace of all probes to this path
+        "trace_buffer_size": 200000,  # maximum number of trace spans kept
+        "source_addresses": [],  # uplinks (source addresses or interfaces) to probe from
     }
 
+# DNS wire-format constants used by candidate discovery
+DNS_TYPE_A = 1
+DNS_TYPE_OPT = 41
+DNS_CLASS_IN = 1
+EDNS_OPTION_ECS = 8
+
 
 class Logger:
-    """A utility class for stylized log output."""
+    """A utility class for stylized log output.
 
-    @staticmethod
-    def header(title: str) -> None:
+    The picker reports progress through a Logger instance. Subclass it (overriding _print or
+    individual methods) to redirect output, or use SilentLogger to suppress it.
+
+    Parameters:
+    -----------
+    stream : Optional[TextIO], default=None
+        Stream to write to (sys.stdout at the time of writing if None)
+    prefix : str, default=''
+        Text put in front of every non-empty line (e.g. '[xbox] ' for a batch profile)
+    """
+
+    def __init__(self, stream: Optional[TextIO] = None, prefix: str = ""):
+        self.stream = stream
+        self.prefix = prefix
+
+    def with_prefix(self, prefix: str) -> "Logger":
+        """Returns a copy of this logger that puts prefix in front of every line."""
+        logger = copy.copy(self)
+        logger.prefix = prefix
+        return logger
+
+    def _print(self, text: str = "", end: str = "\n") -> None:
+        """Writes a line of output; every other method goes through here."""
+        if self.prefix:
+            text = "\n".join(self.prefix + line if line else line for line in text.split("\n"))
+        print(text, end=end, file=self.stream or sys.stdout)
+
+    def header(self, title: str) -> None:
         """Prints a header with the given title."""
-        print("\n" + "=" * 62)
-        print(f"   {title}")
-        print("=" * 62)
+        self._print("\n" + "=" * 62)
+        self._print(f"   {title}")
+        self._print("=" * 62)
 
-    @staticmethod
-    def section(title: str) -> None:
+    def section(self, title: str) -> None:
         """Prints a section title."""
-        print(f"\n📋 {title}")
-        print("─" * (len(title) + 4))
+        self._print(f"\n📋 {title}")
+        self._print("─" * (len(title) + 4))
 
-    @staticmethod
-    def service_start(name: str, total: int, current: int) -> None:
+    def service_start(self, name: str, total: int, current: int) -> None:
         """Prints a message when a service test starts."""
-        print(f"  🔍 [{current:2d}/{total}] Testing {name}...")
+        self._print(f"  🔍 [{current:2d}/{total}] Testing {name}...")
 
-    @staticmethod
     def service_result(
-        name: str, ip: str, latency: float, total: int, current: int, status: str = "success"
+        self, name: str, ip: str, latency: float, total: int, current: int, status: str = "success"
     ) -> None:
         """Prints the result of a service test."""
         if status == "success" and ip:
@@ -61,10 +123,20 @@ class Logger:
             emoji = "⚠️"
             status_text = "Test failed"
 
-        print(f"  {emoji} [{current:2d}/{total}] {name:<25} -> {status_text}")
+        self._print(f"  {emoji} [{current:2d}/{total}] {name:<25} -> {status_text}")
 
-    @staticmethod
-    def progress(current: int, total: int, best_ip: str = "", best_time: float = 0, end: str = '\r') -> None:
+    def uplink_result(self, source: str, ip: str, latency: float) -> None:
+        """Prints the result of a service test over one uplink."""
+        status_text = f"{ip} ({latency:.1f}ms)" if ip else "No available IP found"
+        self._print(f"       ↳ via {source:<20} -> {status_text}")
+
+    def discovery_result(self, name: str, added: int, total: int) -> None:
+        """Prints the result of DNS candidate discovery for a service."""
+        self._print(f"  🌐 {name:<25} -> +{added} new IPs ({total} candidates)")
+
+    def progress(
+        self, current: int, total: int, best_ip: str = "", best_time: float = 0, end: str = '\r'
+    ) -> None:
         """Prints a progress bar (only for very slow operations)."""
         # Only show progress for large IP sets (>100) and when progress is meaningful
         if total < 100 or current % 20 != 0:
@@ -78,38 +150,56 @@ class Logger:
         if best_ip and best_time < float("inf"):
             best_info = f" | Best: {best_ip} ({best_time:.1f}ms)"
 
-        print(f"    📊 Progress: [{bar}] {percent:5.1f}% ({current}/{total}){best_info}", end=end)
+        self._print(
+            f"    📊 Progress: [{bar}] {percent:5.1f}% ({current}/{total}){best_info}", end=end
+        )
 
-    @staticmethod
-    def completion_summary(total_time: float) -> None:
+    def completion_summary(self, total_time: float) -> None:
         """Prints a summary upon completion."""
-        print("\n" + "=" * 62)
-        print(f"   Testing complete! Total time: {total_time:.1f} seconds")
-        print("=" * 62)
+        self._print("\n" + "=" * 62)
+        self._print(f"   Testing complete! Total time: {total_time:.1f} seconds")
+        self._print("=" * 62)
 
-    @staticmethod
-    def file_generated(filename: str) -> None:
+    def file_generated(self, filename: str) -> None:
         """Prints a message when a file is generated."""
-        print(f"\n📄 Hosts file generated: {filename}")
+        self._print(f"\n📄 Hosts file generated: {filename}")
 
-    @staticmethod
-    def usage_instructions() -> None:
+    def trace_generated(self, filename: str, spans: int) -> None:
+        """Prints a message when a probe trace is written."""
+        self._print(f"\n🧭 Probe trace saved: {filename} ({spans} spans)")
+
+    def snapshot_generated(self, filename: str) -> None:
+        """Prints a message when a measurement snapshot is written."""
+        self._print(f"\n📦 Measurement snapshot saved: {filename}")
+
+    def usage_instructions(self) -> None:
         """Prints usage instructions."""
-        print("\n📖 Usage Instructions:")
-        print("   1. View the contents of the generated hosts file")
-        print("   2. Copy only the necessary entries to the system hosts file")
-        print("   3. It is recommended to only replace problematic IP addresses")
-        print("   4. Some services use global CDN, which may not require manual configuration")
+        self._print("\n📖 Usage Instructions:")
+        self._print("   1. View the contents of the generated hosts file")
+        self._print("   2. Copy only the necessary entries to the system hosts file")
+        self._print("   3. It is recommended to only replace problematic IP addresses")
+        self._print(
+            "   4. Some services use global CDN, which may not require manual configuration"
+        )
 
-    @staticmethod
-    def error(message: str) -> None:
+    def error(self, message: str) -> None:
         """Prints an error message."""
-        print(f"❌ Error: {message}")
+        self._print(f"❌ Error: {message}")
 
-    @staticmethod
-    def warning(message: str) -> None:
+    def warning(self, message: str) -> None:
         """Prints a warning message."""
-        print(f"⚠️  Warning: {message}")
+        self._print(f"⚠️  Warning: {message}")
+
+    def info(self, message: str) -> None:
+        """Prints a plain message."""
+        self._print(message)
+
+
+class SilentLogger(Logger):
+    """Logger that discards all output, for embedding the picker in other programs."""
+
+    def _print(self, text: str = "", end: str = "\n") -> None:
+        pass
 
 
 @dataclass
@@ -134,6 +224,1092 @@ class ServiceConfig:
     static_ip: Optional[str] = None
 
 
+@dataclass
+class ServiceResult:
+    """Outcome of testing one dynamic service.
+
+    Parameters:
+    -----------
+    key : str
+        Service key from DYNAMIC_SERVICES
+    name : str
+        Readable name of the service
+    domains : List[str]
+        Domains mapped to the selected IP
+    ip : str
+        Selected IP address ('' if none was found)
+    latency : float
+        Average latency of the selected IP (milliseconds), float('inf') if none was found
+    status : str
+        'success', 'no_ip' or 'error'
+    shortlist : List[Tuple[str, float]]
+        Best measured candidates as (IP address, mean latency), best first
+    """
+
+    key: str
+    name: str
+    domains: List[str]
+    ip: str
+    latency: float
+    status: str
+    shortlist: List[Tuple[str, float]] = field(default_factory=list)
+
+
+@dataclass
+class PickResult:
+    """Structured result of a complete picker run.
+
+    Parameters:
+    -----------
+    profile : str
+        Name of the profile that produced the result
+    services : Dict[str, ServiceResult]
+        Dictionary of service keys to test outcomes
+    hosts_content : str
+        Generated hosts file content
+    output_file : Optional[str]
+        Path the hosts file was written to (None if it was not written)
+    elapsed : float
+        Wall-clock duration of the run (seconds)
+    error : Optional[str], default=None
+        Reason the run failed, None on success
+    uplinks : Dict[str, Dict[str, ServiceResult]], default={}
+        Per-uplink test outcomes, keyed by source address or interface ('source_addresses')
+    """
+
+    profile: str
+    services: Dict[str, ServiceResult]
+    hosts_content: str
+    output_file: Optional[str]
+    elapsed: float
+    error: Optional[str] = None
+    uplinks: Dict[str, Dict[str, ServiceResult]] = field(default_factory=dict)
+
+    @property
+    def ok(self) -> bool:
+        """True if the run completed and the hosts file was written."""
+        return self.error is None
+
+
+def discovered_file_path(ip_file_path: str) -> str:
+    """Returns the sidecar file that holds DNS-discovered candidates for an IP file.
+
+    Parameters:
+    -----------
+    ip_file_path : str
+        Path to the hand-maintained IP file (e.g. 'data/Office_CDN.txt')
+
+    Returns:
+    --------
+    str
+        Sidecar path (e.g. 'data/Office_CDN.discovered.txt')
+    """
+    root, ext = os.path.splitext(ip_file_path)
+    return f"{root}.discovered{ext or '.txt'}"
+
+
+def read_ip_file(ip_file_path: str) -> List[str]:
+    """Reads IP addresses from a file, skipping empty lines and comments.
+
+    Parameters:
+    -----------
+    ip_file_path : str
+        Path to the file containing IP addresses (one IP per line)
+
+    Returns:
+    --------
+    List[str]
+        IP addresses in file order, or an empty list if the file does not exist
+    """
+    if not os.path.exists(ip_file_path):
+        return []
+
+    ips = []
+    with open(ip_file_path, "r", encoding="utf-8") as file:
+        for line in file:
+            ip = line.strip()
+            if ip and not ip.startswith("#"):  # Skip empty lines and comments
+                ips.append(ip)
+    return ips
+
+
+def read_candidate_ips(ip_file_path: str) -> List[str]:
+    """Reads the candidate IPs of a service: its IP file followed by its discovered sidecar.
+
+    Parameters:
+    -----------
+    ip_file_path : str
+        Path to the hand-maintained IP file
+
+    Returns:
+    --------
+    List[str]
+        Deduplicated candidate IPs, hand-maintained entries first
+    """
+    ips = read_ip_file(ip_file_path) + read_ip_file(discovered_file_path(ip_file_path))
+    return list(dict.fromkeys(ips))
+
+
+def format_ip(value: int, ipv6: bool = False) -> str:
+    """Formats an integer IP address as a string.
+
+    Parameters:
+    -----------
+    value : int
+        IP address as an integer
+    ipv6 : bool, default=False
+        Whether the value is an IPv6 address; the value alone cannot tell, since IPv6
+        addresses like '::1' also fit in 32 bits
+
+    Returns:
+    --------
+    str
+        Dotted IPv4 or compressed IPv6 address
+    """
+    if ipv6:
+        return socket.inet_ntop(socket.AF_INET6, value.to_bytes(16, "big"))
+    return socket.inet_ntoa(value.to_bytes(4, "big"))
+
+
+class CandidateSet:
+    """Packed candidate IP addresses of a single service.
+
+    Addresses are stored as 4-byte (IPv4) and 16-byte (IPv6) big-endian blocks, usually
+    views into the memory-mapped CandidateIndex. Iterating yields address strings, IPv4
+    first; slicing returns a new CandidateSet without copying.
+
+    Parameters:
+    -----------
+    ipv4 : bytes or memoryview, default=b''
+        Packed IPv4 addresses
+    ipv6 : bytes or memoryview, default=b''
+        Packed IPv6 addresses
+    """
+
+    __slots__ = ("_ipv4", "_ipv6")
+
+    def __init__(self, ipv4=b"", ipv6=b""):
+        self._ipv4 = ipv4
+        self._ipv6 = ipv6
+
+    @classmethod
+    def from_ips(cls, ips: Iterable[str]) -> "CandidateSet":
+        """Packs IP address strings into a candidate set, keeping their order per family.
+
+        Parameters:
+        -----------
+        ips : Iterable[str]
+            IP addresses; invalid entries raise ValueError
+        """
+        addresses = [ipaddress.ip_address(ip) for ip in ips]
+        return cls(
+            b"".join(address.packed for address in addresses if address.version == 4),
+            b"".join(address.packed for address in addresses if address.version == 6),
+        )
+
+    @property
+    def ipv4_count(self) -> int:
+        """Number of IPv4 candidates."""
+        return len(self._ipv4) // 4
+
+    @property
+    def ipv4_packed(self):
+        """Packed big-endian IPv4 addresses (4 bytes each)."""
+        return self._ipv4
+
+    @property
+    def ipv6_packed(self):
+        """Packed big-endian IPv6 addresses (16 bytes each)."""
+        return self._ipv6
+
+    def __len__(self) -> int:
+        return self.ipv4_count + len(self._ipv6) // 16
+
+    def __iter__(self) -> Iterator[str]:
+        # Format from the packed block so the address family is never guessed
+        for offset in range(0, len(self._ipv4), 4):
+            yield socket.inet_ntop(socket.AF_INET, self._ipv4[offset : offset + 4])
+        for offset in range(0, len(self._ipv6), 16):
+            yield socket.inet_ntop(socket.AF_INET6, self._ipv6[offset : offset + 16])
+
+    def __getitem__(self, index: slice) -> "CandidateSet":
+        start, stop, step = index.indices(len(self))
+        if step != 1:
+            raise ValueError("CandidateSet slices do not support a step")
+
+        count = self.ipv4_count
+        return CandidateSet(
+            self._ipv4[min(start, count) * 4 : min(stop, count) * 4],
+            self._ipv6[max(start - count, 0) * 16 : max(stop - count, 0) * 16],
+        )
+
+
+class CandidateIndex:
+    """Compiled, memory-mapped index of the candidate IPs of every dynamic service.
+
+    The index is a single file: a magic number, a JSON table with per-service offsets and
+    the mtime/size of every source file, followed by the packed addresses. It is rebuilt
+    automatically when a source IP file (or its discovered sidecar) changes. If the index
+    cannot be written (e.g. a read-only data directory), it is compiled in memory instead.
+
+    Parameters:
+    -----------
+    index_path : str
+        Path to the compiled index file
+    """
+
+    MAGIC = b"MHPIDX01"
+    VERSION = 1
+
+    def __init__(self, index_path: str):
+        self.index_path = index_path
+        self._mmap: Optional[mmap.mmap] = None
+        self._buffer: Optional[bytes] = None  # In-memory index when the file is unwritable
+        self._table: Dict[str, Dict] = {}
+        self._data_offset = 0
+
+    def load(self, services: Dict[str, ServiceConfig]) -> None:
+        """Memory-maps the index, rebuilding it first if it is missing or stale.
+
+        Parameters:
+        -----------
+        services : Dict[str, ServiceConfig]
+            Dictionary of service keys to configurations
+        """
+        self.close()
+
+        table = self._read_table()
+        if not self._is_current(table, services):
+            try:
+                self.build(services)
+                table = self._read_table()
+            except OSError:
+                table = None
+            if table is None:
+                table, self._buffer = self._compile(services)
+
+        if self._buffer is None:
+            with open(self.index_path, "rb") as file:
+                self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._table = table["services"]
+        self._data_offset = table["data_offset"]
+
+    def get(self, service_key: str) -> CandidateSet:
+        """Returns the candidates of a service (empty if the service is not indexed).
+
+        Parameters:
+        -----------
+        service_key : str
+            Service key from DYNAMIC_SERVICES
+
+        Returns:
+        --------
+        CandidateSet
+            Packed candidate addresses backed by the memory map
+        """
+        entry = self._table.get(service_key)
+        data = self._mmap if self._mmap is not None else self._buffer
+        if entry is None or data is None:
+            return CandidateSet()
+
+        view = memoryview(data)
+        (v4_offset, v4_count), (v6_offset, v6_count) = entry["ipv4"], entry["ipv6"]
+        v4_start = self._data_offset + v4_offset
+        v6_start = self._data_offset + v6_offset
+        return CandidateSet(
+            view[v4_start : v4_start + v4_count * 4],
+            view[v6_start : v6_start + v6_count * 16],
+        )
+
+    def close(self) -> None:
+        """Unmaps the index file."""
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # CandidateSets still reference the map; it is released along with them
+                pass
+            self._mmap = None
+        self._buffer = None
+        self._table = {}
+
+    def build(self, services: Dict[str, ServiceConfig]) -> None:
+        """Compiles the candidate files of all services into the index file.
+
+        Lines that are not valid IP addresses are skipped and duplicates are dropped.
+
+        Parameters:
+        -----------
+        services : Dict[str, ServiceConfig]
+            Dictionary of service keys to configurations
+
+        Exceptions:
+        -------
+        OSError
+            If the index file cannot be written
+        """
+        _, data = self._compile(services)
+        temp_path = f"{self.index_path}.tmp"
+        try:
+            with open(temp_path, "wb") as file:
+                file.write(data)
+            os.replace(temp_path, self.index_path)
+        except OSError:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def _compile(self, services: Dict[str, ServiceConfig]) -> Tuple[Dict, bytes]:
+        """Internal method to compile the candidate files into a table and index contents."""
+        entries = {}
+        blocks = []
+        offset = 0
+
+        for service_key, config in services.items():
+            sources = {path: self._stat(path) for path in self._source_paths(config)}
+            ipv4, ipv6 = {}, {}
+            for ip in read_candidate_ips(config.ip_file_path):
+                try:
+                    address = ipaddress.ip_address(ip)
+                except ValueError:
+                    continue
+                (ipv4 if address.version == 4 else ipv6)[address.packed] = None
+
+            v4_block, v6_block = b"".join(ipv4), b"".join(ipv6)
+            entries[service_key] = {
+                "sources": sources,
+                "ipv4": [offset, len(ipv4)],
+                "ipv6": [offset + len(v4_block), len(ipv6)],
+            }
+            blocks.extend((v4_block, v6_block))
+            offset += len(v4_block) + len(v6_block)
+
+        table = {"version": self.VERSION, "services": entries}
+        header = json.dumps(table, separators=(",", ":")).encode("utf-8")
+        prefix = len(self.MAGIC) + 4 + len(header)
+        padding = b"\x00" * (-prefix % 16)  # Align the packed addresses
+
+        data = b"".join(
+            [self.MAGIC, struct.pack("!I", len(header) + len(padding)), header, padding, *blocks]
+        )
+        table["data_offset"] = prefix + len(padding)
+        return table, data
+
+    def _read_table(self) -> Optional[Dict]:
+        """Internal method to read the JSON table, returning None if the index is unusable."""
+        try:
+            with open(self.index_path, "rb") as file:
+                prefix = file.read(len(self.MAGIC) + 4)
+                if len(prefix) < len(self.MAGIC) + 4 or not prefix.startswith(self.MAGIC):
+                    return None
+                (header_size,) = struct.unpack("!I", prefix[len(self.MAGIC) :])
+                table = json.loads(file.read(header_size).rstrip(b"\x00"))
+        except (OSError, ValueError):
+            return None
+
+        if table.get("version") != self.VERSION:
+            return None
+        table["data_offset"] = len(self.MAGIC) + 4 + header_size
+        return table
+
+    def _is_current(self, table: Optional[Dict], services: Dict[str, ServiceConfig]) -> bool:
+        """Internal method to check that the index covers exactly these services and files."""
+        if table is None or table["services"].keys() != services.keys():
+            return False
+
+        for service_key, config in services.items():
+            sources = {path: self._stat(path) for path in self._source_paths(config)}
+            if table["services"][service_key]["sources"] != sources:
+                return False
+        return True
+
+    @staticmethod
+    def _source_paths(config: ServiceConfig) -> List[str]:
+        """Internal method to list the files a service's candidates are read from."""
+        return [config.ip_file_path, discovered_file_path(config.ip_file_path)]
+
+    @staticmethod
+    def _stat(path: str) -> List[int]:
+        """Internal method to fingerprint a source file as [mtime_ns, size]."""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return [-1, -1]
+        return [stat.st_mtime_ns, stat.st_size]
+
+
+class MeasurementStore:
+    """Columnar store of per-attempt latency measurements for one service's candidates.
+
+    Each candidate is a row; ranking, percentiles, jitter and top-k selection are computed
+    with vectorized NumPy operations over all rows at once. Rows that were never probed
+    (e.g. skipped by early termination) are excluded from every ranking.
+
+    Parameters:
+    -----------
+    ips : np.ndarray
+        Candidate IPs as integers (uint32 when all candidates are IPv4)
+    attempts : int
+        Number of ping attempts recorded per IP
+    ipv6 : Optional[np.ndarray], default=None
+        bool array marking the IPv6 rows (all rows are IPv4 if None)
+
+    Attributes:
+    -----------
+    rtts : np.ndarray
+        float32 array of shape (len(ips), attempts), NaN where no reply was received
+    lost : np.ndarray
+        bool array of shape (len(ips), attempts), True where an attempt was lost
+    measured : np.ndarray
+        bool array of shape (len(ips),), True for candidates that were probed
+    """
+
+    # Ranking key weight per lost attempt; larger than any plausible RTT (milliseconds)
+    LOSS_PENALTY = 1e9
+
+    def __init__(self, ips: np.ndarray, attempts: int, ipv6: Optional[np.ndarray] = None):
+        self.ips = ips
+        self.ipv6 = ipv6 if ipv6 is not None else np.zeros(len(ips), dtype=bool)
+        self.attempts = max(1, attempts)
+        self.rtts = np.full((len(ips), self.attempts), np.nan, dtype=np.float32)
+        self.lost = np.zeros((len(ips), self.attempts), dtype=bool)
+        self.measured = np.zeros(len(ips), dtype=bool)
+
+    @classmethod
+    def from_candidates(cls, candidates: CandidateSet, attempts: int) -> "MeasurementStore":
+        """Creates an empty store with one row per candidate, in candidate order.
+
+        Parameters:
+        -----------
+        candidates : CandidateSet
+            Candidate IP addresses
+        attempts : int
+            Number of ping attempts recorded per IP
+
+        Returns:
+        --------
+        MeasurementStore
+            Store whose row i corresponds to the i-th candidate
+        """
+        ips = np.frombuffer(candidates.ipv4_packed, dtype=">u4").astype(np.uint32)
+        ipv6 = np.zeros(len(candidates), dtype=bool)
+        if len(candidates.ipv6_packed):
+            halves = struct.iter_unpack("!QQ", candidates.ipv6_packed)
+            ipv6_ips = np.fromiter((high << 64 | low for high, low in halves), dtype=object)
+            ips = np.concatenate([ips.astype(object), ipv6_ips])
+            ipv6[candidates.ipv4_count :] = True
+        return cls(ips, attempts, ipv6)
+
+    def __len__(self) -> int:
+        return len(self.ips)
+
+    def record(self, row: int, rtts: List[float]) -> None:
+        """Records the per-attempt RTTs of one candidate.
+
+        Parameters:
+        -----------
+        row : int
+            Row of the candidate
+        rtts : List[float]
+            RTT of each attempt (milliseconds), float('inf') for lost attempts
+        """
+        values = np.asarray(rtts[: self.attempts], dtype=np.float32)
+        received = np.isfinite(values)
+        self.rtts[row, : len(values)] = np.where(received, values, np.nan)
+        self.lost[row, : len(values)] = ~received
+        self.measured[row] = True
+
+    def ip_at(self, row: int) -> str:
+        """Returns the IP address of a row as a string."""
+        return format_ip(int(self.ips[row]), bool(self.ipv6[row]))
+
+    def mean_latency(self) -> np.ndarray:
+        """Mean RTT of the received replies per candidate (inf if none were received)."""
+        received = ~np.isnan(self.rtts)
+        counts = received.sum(axis=1)
+        totals = np.where(received, self.rtts, 0.0).sum(axis=1, dtype=np.float64)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(counts > 0, totals / counts, np.inf)
+
+    def loss_rate(self) -> np.ndarray:
+        """Fraction of lost attempts per candidate (NaN for unprobed candidates)."""
+        rates = self.lost.sum(axis=1) / self.attempts
+        return np.where(self.measured, rates, np.nan)
+
+    def jitter(self, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Mean absolute difference between consecutive received RTTs per candidate.
+
+        Lost attempts are skipped, so the RTTs before and after a loss are compared.
+        Candidates with fewer than two replies have zero jitter.
+
+        Parameters:
+        -----------
+        rows : Optional[np.ndarray], default=None
+            Rows to compute the jitter for (all rows if None)
+        """
+        rtts = self.rtts if rows is None else self.rtts[rows]
+        if self.attempts < 2:
+            return np.zeros(len(rtts), dtype=np.float64)
+
+        # Push NaNs to the end of each row so received RTTs become consecutive
+        order = np.argsort(np.isnan(rtts), axis=1, kind="stable")
+        compacted = np.take_along_axis(rtts, order, axis=1).astype(np.float64)
+        deltas = np.abs(np.diff(compacted, axis=1))
+        valid = ~np.isnan(deltas)
+        counts = valid.sum(axis=1)
+        totals = np.where(valid, deltas, 0.0).sum(axis=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(counts > 0, totals / counts, 0.0)
+
+    def percentile(self, q: float) -> np.ndarray:
+        """Per-candidate percentile of the received RTTs (inf if none were received).
+
+        Uses linear interpolation like np.percentile, vectorized across all rows.
+
+        Parameters:
+        -----------
+        q : float
+            Percentile in [0, 100]
+        """
+        ordered = np.sort(self.rtts, axis=1).astype(np.float64)  # NaNs sort last
+        counts = (~np.isnan(ordered)).sum(axis=1)
+        position = (q / 100.0) * np.maximum(counts - 1, 0)
+        lower = np.floor(position).astype(np.intp)
+        upper = np.minimum(lower + 1, np.maximum(counts - 1, 0))
+        low_values = np.take_along_axis(ordered, lower[:, None], axis=1)[:, 0]
+        high_values = np.take_along_axis(ordered, upper[:, None], axis=1)[:, 0]
+        values = low_values + (high_values - low_values) * (position - lower)
+        return np.where(counts > 0, values, np.inf)
+
+    def ranking_key(self) -> np.ndarray:
+        """Sort key per candidate: lost attempts first, then mean latency (lower is better).
+
+        Unprobed and fully unreachable candidates get inf.
+        """
+        key = self.lost.sum(axis=1) * self.LOSS_PENALTY + self.mean_latency()
+        return np.where(self.measured, key, np.inf)
+
+    def rank(self) -> np.ndarray:
+        """Returns the rows of all reachable candidates, best first.
+
+        Ties on the ranking key are broken by lower jitter.
+        """
+        key = self.ranking_key()
+        return self._order(np.flatnonzero(np.isfinite(key)), key)
+
+    def top_k(self, k: int) -> np.ndarray:
+        """Returns the rows of the k best reachable candidates, best first.
+
+        Selects with np.argpartition, so only the k winners are fully sorted.
+
+        Parameters:
+        -----------
+        k : int
+            Number of candidates to return
+        """
+        key = self.ranking_key()
+        reachable = np.flatnonzero(np.isfinite(key))
+        if k <= 0 or len(reachable) == 0:
+            return np.empty(0, dtype=np.intp)
+
+        if k < len(reachable):
+            reachable = reachable[np.argpartition(key[reachable], k - 1)[:k]]
+        return self._order(reachable, key)
+
+    def _order(self, rows: np.ndarray, key: np.ndarray) -> np.ndarray:
+        """Internal method to sort rows by key, breaking ties by jitter.
+
+        Jitter is only computed for rows whose key is tied with a neighbour.
+        """
+        rows = rows[np.argsort(key[rows], kind="stable")]
+        sorted_key = key[rows]
+        tied = sorted_key[1:] == sorted_key[:-1]
+        if tied.any():
+            # Tied groups are contiguous, so re-sorting their positions by (key, jitter)
+            # in place keeps the overall key order intact. A mask marks both sides of
+            # each tie without sorting the positions again.
+            positions = np.zeros(len(rows), dtype=bool)
+            positions[:-1] |= tied
+            positions[1:] |= tied
+            tied_rows = rows[positions]
+            rows[positions] = tied_rows[np.lexsort((self.jitter(tied_rows), key[tied_rows]))]
+        return rows
+
+    def shortlist(self, k: int) -> List[Tuple[str, float]]:
+        """Returns the k best candidates for later probing stages.
+
+        Parameters:
+        -----------
+        k : int
+            Number of candidates to return
+
+        Returns:
+        --------
+        List[Tuple[str, float]]
+            (IP address, mean latency in milliseconds), best first
+        """
+        rows = self.top_k(k)
+        latency = self.mean_latency()[rows]
+        return [(self.ip_at(row), float(value)) for row, value in zip(rows, latency)]
+
+    def best(self) -> Tuple[str, float]:
+        """Returns the best candidate and its mean latency, or ('', inf) if none replied."""
+        shortlist = self.shortlist(1)
+        return shortlist[0] if shortlist else ("", float("inf"))
+
+
+@dataclass
+class MeasurementSnapshot:
+    """Compact per-IP measurement summary of one node, or a merge of many nodes.
+
+    Snapshots are exported after a scan, combined with merge() across a fleet, and can seed
+    the scan order of later runs. Each service maps to equally long columns:
+    'ips' (str), 'sent' and 'received' (attempt counts), 'mean' and 'jitter' (milliseconds).
+
+    Parameters:
+    -----------
+    node : str
+        Label of the node that measured (or 'merged')
+    site : str
+        Site label used to group nodes when merging
+    timestamp : float
+        Unix time the measurements were taken (latest input for merged snapshots)
+    services : Dict[str, Dict[str, np.ndarray]]
+        Dictionary of service keys to measurement columns
+    """
+
+    FORMAT = "mhp-snapshot"
+    VERSION = 1
+    COLUMNS = ("ips", "sent", "received", "mean", "jitter")
+
+    node: str
+    site: str
+    timestamp: float
+    services: Dict[str, Dict[str, np.ndarray]]
+
+    @classmethod
+    def from_stores(
+        cls, node: str, site: str, stores: Dict[str, MeasurementStore]
+    ) -> "MeasurementSnapshot":
+        """Summarizes the probed rows of measurement stores into a snapshot.
+
+        Parameters:
+        -----------
+        node : str
+            Label of this node
+        site : str
+            Site label of this node
+        stores : Dict[str, MeasurementStore]
+            Dictionary of service keys to measurement stores
+
+        Returns:
+        --------
+        MeasurementSnapshot
+            Snapshot holding one entry per probed IP
+        """
+        services = {}
+        for service_key, store in stores.items():
+            rows = np.flatnonzero(store.measured)
+            received = (~np.isnan(store.rtts[rows])).sum(axis=1)
+            services[service_key] = {
+                "ips": np.array([store.ip_at(row) for row in rows], dtype=object),
+                "sent": (received + store.lost[rows].sum(axis=1)).astype(np.int64),
+                "received": received.astype(np.int64),
+                "mean": np.where(received > 0, store.mean_latency()[rows], np.inf),
+                "jitter": store.jitter(rows),
+            }
+        return cls(node=node, site=site, timestamp=time.time(), services=services)
+
+    @classmethod
+    def merge(
+        cls, snapshots: List["MeasurementSnapshot"], node: str = "merged", site: str = ""
+    ) -> "MeasurementSnapshot":
+        """Combines snapshots into one, aggregating the measurements of each IP.
+
+        Attempt counts are summed, so loss rates are pooled across nodes; mean latency and
+        jitter are averaged weighted by the replies each node received.
+
+        Parameters:
+        -----------
+        snapshots : List[MeasurementSnapshot]
+            Snapshots to combine
+        node : str, default='merged'
+            Node label of the result
+        site : str, default=''
+            Site label of the result
+
+        Returns:
+        --------
+        MeasurementSnapshot
+            Snapshot holding one entry per distinct IP of each service
+        """
+        service_keys = dict.fromkeys(key for snapshot in snapshots for key in snapshot.services)
+        services = {}
+
+        for service_key in service_keys:
+            parts = [s.services[service_key] for s in snapshots if service_key in s.services]
+            columns = {
+                name: np.concatenate([part[name] for part in parts]) for name in cls.COLUMNS
+            }
+
+            ips, inverse = np.unique(columns["ips"].astype(str), return_inverse=True)
+            received = columns["received"]
+            replied = received > 0
+            weights = np.where(replied, received, 0).astype(np.float64)
+            total_received = np.bincount(inverse, weights=weights, minlength=len(ips))
+            mean_sum = np.bincount(
+                inverse,
+                weights=np.where(replied, columns["mean"], 0.0) * weights,
+                minlength=len(ips),
+            )
+            jitter_sum = np.bincount(
+                inverse, weights=columns["jitter"] * weights, minlength=len(ips)
+            )
+
+            with np.errstate(divide="ignore", invalid="ignore"):
+                services[service_key] = {
+                    "ips": ips.astype(object),
+                    "sent": np.bincount(
+                        inverse, weights=columns["sent"], minlength=len(ips)
+                    ).astype(np.int64),
+                    "received": total_received.astype(np.int64),
+                    "mean": np.where(total_received > 0, mean_sum / total_received, np.inf),
+                    "jitter": np.where(total_received > 0, jitter_sum / total_received, 0.0),
+                }
+
+        timestamp = max((snapshot.timestamp for snapshot in snapshots), default=time.time())
+        return cls(node=node, site=site, timestamp=timestamp, services=services)
+
+    def rank(self, service_key: str) -> List[Tuple[str, float]]:
+        """Ranks the reachable IPs of a service, best first.
+
+        IPs are ordered by loss rate, then mean latency, then jitter, like
+        MeasurementStore.rank().
+
+        Parameters:
+        -----------
+        service_key : str
+            Service key from DYNAMIC_SERVICES
+
+        Returns:
+        --------
+        List[Tuple[str, float]]
+            (IP address, mean latency in milliseconds), best first
+        """
+        columns = self.services.get(service_key)
+        if columns is None:
+            return []
+
+        received = columns["received"]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            loss_rate = 1.0 - received / columns["sent"]
+        key = loss_rate * MeasurementStore.LOSS_PENALTY + columns["mean"]
+        reachable = np.flatnonzero((received > 0) & np.isfinite(key))
+        order = reachable[np.lexsort((columns["jitter"][reachable], key[reachable]))]
+        return [(str(columns["ips"][row]), float(columns["mean"][row])) for row in order]
+
+    def save(self, path: str) -> None:
+        """Writes the snapshot as gzip-compressed JSON.
+
+        Parameters:
+        -----------
+        path : str
+            Output file path (conventionally '*.json.gz')
+        """
+        services = {}
+        for service_key, columns in self.services.items():
+            received = columns["received"]
+            services[service_key] = {
+                "ips": [str(ip) for ip in columns["ips"]],
+                "sent": columns["sent"].tolist(),
+                "received": received.tolist(),
+                # Unreachable IPs are stored as 0 ms; 'received' marks them on load
+                "mean": np.round(np.where(received > 0, columns["mean"], 0.0), 3).tolist(),
+                "jitter": np.round(columns["jitter"], 3).tolist(),
+            }
+
+        document = {
+            "format": self.FORMAT,
+            "version": self.VERSION,
+            "node": self.node,
+            "site": self.site,
+            "timestamp": self.timestamp,
+            "services": services,
+        }
+        with gzip.open(path, "wt", encoding="utf-8") as file:
+            json.dump(document, file, separators=(",", ":"))
+
+    @classmethod
+    def load(cls, path: str) -> "MeasurementSnapshot":
+        """Reads a snapshot written by save().
+
+        Parameters:
+        -----------
+        path : str
+            Snapshot file path
+
+        Returns:
+        --------
+        MeasurementSnapshot
+            The loaded snapshot
+
+        Exceptions:
+        -------
+        ValueError
+            If the file is not a snapshot of a supported version
+        """
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as file:
+                document = json.load(file)
+        except (OSError, json.JSONDecodeError) as e:
+            raise ValueError(f"Unreadable snapshot {path}: {e}")
+
+        if document.get("format") != cls.FORMAT or document.get("version") != cls.VERSION:
+            raise ValueError(f"Unsupported snapshot format: {path}")
+
+        services = {}
+        for service_key, columns in document["services"].items():
+            received = np.asarray(columns["received"], dtype=np.int64)
+            mean = np.asarray(columns["mean"], dtype=np.float64)
+            services[service_key] = {
+                "ips": np.asarray(columns["ips"], dtype=object),
+                "sent": np.asarray(columns["sent"], dtype=np.int64),
+                "received": received,
+                "mean": np.where(received > 0, mean, np.inf),
+                "jitter": np.asarray(columns["jitter"], dtype=np.float64),
+            }
+
+        return cls(
+            node=document["node"],
+            site=document["site"],
+            timestamp=document["timestamp"],
+            services=services,
+        )
+
+
+class _TraceSpan:
+    """Times one span and appends it to the tracer's ring buffer on exit."""
+
+    __slots__ = ("_events", "_name", "_category", "_group", "_args", "_start")
+
+    def __init__(self, events, name: str, category: str, group: int, args: Optional[Dict]):
+        self._events = events
+        self._name = name
+        self._category = category
+        self._group = group
+        self._args = args
+
+    def __enter__(self) -> "_TraceSpan":
+        self._start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> bool:
+        end = time.perf_counter_ns()
+        args = self._args
+        if exc_type is not None:
+            args = {**(args or {}), "error": exc_type.__name__}
+        self._events.append((self._name, self._category, self._start, end, self._group, args))
+        return False
+
+
+class _NullSpan:
+    """Span returned by a disabled tracer; does nothing."""
+
+    __slots__ = ()
+
+    def __enter__(self) -> "_NullSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> bool:
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class ProbeTracer:
+    """Opt-in tracer that records spans of each service, IP and probe phase.
+
+    Spans are appended to a fixed-size ring buffer (oldest spans are dropped) and written as
+    Chrome trace-event JSON, which can be loaded into Perfetto or chrome://tracing. Lanes
+    (threads) are only assigned when the trace is written, keeping recording cheap.
+
+    Parameters:
+    -----------
+    capacity : int, default=200000
+        Maximum number of spans kept
+    enabled : bool, default=True
+        If False, span() returns a no-op span and nothing is recorded
+    """
+
+    def __init__(self, capacity: int = 200_000, enabled: bool = True):
+        self.enabled = enabled
+        self._events: collections.deque = collections.deque(maxlen=max(1, capacity))
+        self._groups = itertools.count(1)
+        self._origin = time.perf_counter_ns()
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    def new_group(self) -> int:
+        """Returns an id that keeps related spans (e.g. one ping and its phases) on one lane."""
+        return next(self._groups)
+
+    def span(
+        self, name: str, category: str, group: int = 0, args: Optional[Dict] = None
+    ):
+        """Returns a context manager that records a span around its body.
+
+        Parameters:
+        -----------
+        name : str
+            Span name shown in the trace viewer
+        category : str
+            Span category; each category is shown as a separate process
+        group : int, default=0
+            Id from new_group(); spans of one group share a lane
+        args : Optional[Dict], default=None
+            Extra data attached to the span (must be JSON serializable)
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return _TraceSpan(self._events, name, category, group, args)
+
+    def write(self, path: str) -> int:
+        """Writes the recorded spans as a Chrome trace-event JSON file.
+
+        Parameters:
+        -----------
+        path : str
+            Output file path
+
+        Returns:
+        --------
+        int
+            Number of spans written
+        """
+        events = list(self._events)
+
+        # Extent of each group, used to pack groups onto as few lanes as possible
+        extents: Dict[Tuple[str, int], List[int]] = {}
+        for _, category, start, end, group, _ in events:
+            extent = extents.setdefault((category, group), [start, end])
+            extent[0] = min(extent[0], start)
+            extent[1] = max(extent[1], end)
+
+        pids: Dict[str, int] = {}
+        lanes: Dict[Tuple[str, int], int] = {}
+        free_lanes: Dict[str, List[Tuple[int, int]]] = {}
+        lane_counts: Dict[str, int] = {}
+        for (category, group), (start, end) in sorted(extents.items(), key=lambda item: item[1]):
+            pids.setdefault(category, len(pids) + 1)
+            heap = free_lanes.setdefault(category, [])
+            if heap and heap[0][0] <= start:
+                _, lane = heapq.heappop(heap)
+            else:
+                lane = lane_counts[category] = lane_counts.get(category, 0) + 1
+            heapq.heappush(heap, (end, lane))
+            lanes[(category, group)] = lane
+
+        trace_events = []
+        for category, pid in pids.items():
+            trace_events.append(
+                {"name": "process_name", "ph": "M", "pid": pid, "args": {"name": category}}
+            )
+            for lane in range(1, lane_counts[category] + 1):
+                trace_events.append(
+                    {
+                        "name": "thread_name",
+                        "ph": "M",
+                        "pid": pid,
+                        "tid": lane,
+                        "args": {"name": f"{category} lane {lane}"},
+                    }
+                )
+
+        # Parents before children so viewers nest spans that start together
+        for name, category, start, end, group, args in sorted(
+            events, key=lambda event: (event[2], event[2] - event[3])
+        ):
+            trace_event = {
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": (start - self._origin) / 1000,
+                "dur": (end - start) / 1000,
+                "pid": pids[category],
+                "tid": lanes[(category, group)],
+            }
+            if args:
+                trace_event["args"] = args
+            trace_events.append(trace_event)
+
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(
+                {"traceEvents": trace_events, "displayTimeUnit": "ms"},
+                file,
+                separators=(",", ":"),
+            )
+        return len(events)
+
+
+class ProbeCache:
+    """Probe layer shared by several testers, so overlapping candidates are measured once.
+
+    Concurrent requests for the same probe await a single in-flight measurement, and
+    finished measurements are reused. All shared probes run under one concurrency limit.
+
+    Parameters:
+    -----------
+    semaphore_limit : int, default=50
+        Concurrency limit for all testers using this cache
+    """
+
+    def __init__(self, semaphore_limit: int = 50):
+        self.semaphore = asyncio.Semaphore(semaphore_limit)
+        # key -> [probe task, number of waiting testers]
+        self._entries: Dict[Tuple, List] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def probe(self, key: Tuple, probe_factory) -> List[float]:
+        """Returns the cached result for key, starting probe_factory() if there is none.
+
+        A probe is only cancelled once every tester waiting on it has been cancelled
+        (e.g. by early termination), so one tester stopping early does not discard
+        a measurement another tester still needs.
+
+        Parameters:
+        -----------
+        key : Tuple
+            Probe identity (IP address and probe settings)
+        probe_factory : Callable[[], Awaitable[List[float]]]
+            Starts the measurement
+
+        Returns:
+        --------
+        List[float]
+            RTT of each attempt (milliseconds), float('inf') for attempts that failed
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = [asyncio.ensure_future(probe_factory()), 0]
+
+        task = entry[0]
+        entry[1] += 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if entry[1] == 1 and not task.done():
+                task.cancel()
+                if self._entries.get(key) is entry:
+                    del self._entries[key]
+            raise
+        finally:
+            entry[1] -= 1
+
+
 class AsyncPingTester:
     """Asynchronous IP address network latency tester.
 
@@ -149,6 +1325,19 @@ class AsyncPingTester:
         Concurrency limit semaphore
     good_enough_threshold : float, default=50.0
         Latency threshold (milliseconds) below which testing can stop early
+    probe_cache : Optional[ProbeCache], default=None
+        Probe layer shared with other testers; its concurrency limit replaces semaphore_limit
+    tracer : Optional[ProbeTracer], default=None
+        Records spans of every ping and its phases (no tracing if None)
+    source : Optional[str], default=None
+        Source address or interface name the pings are bound to (default route if None)
+    min_results : int, default=1
+        Number of reachable candidates to measure before testing can stop early
+    early_exit : bool, default=True
+        Whether testing may stop early at all; disable it to measure every candidate
+    semaphore : Optional[asyncio.Semaphore], default=None
+        Concurrency limit shared with other testers; replaces semaphore_limit (the probe
+        cache's limit takes precedence)
     """
 
     def __init__(
@@ -157,12 +1346,119 @@ class AsyncPingTester:
         timeout: float = 0.5,
         semaphore_limit: int = 50,
         good_enough_threshold: float = 50.0,
+        probe_cache: Optional[ProbeCache] = None,
+        tracer: Optional[ProbeTracer] = None,
+        source: Optional[str] = None,
+        min_results: int = 1,
+        early_exit: bool = True,
+        semaphore: Optional[asyncio.Semaphore] = None,
     ):
         self.attempts = attempts
         self.timeout = timeout
-        self.semaphore = asyncio.Semaphore(semaphore_limit)
+        self.source = source
+        self.min_results = max(1, min_results)
+        self.early_exit = early_exit
+        self.probe_cache = probe_cache
+        self.tracer = tracer if tracer is not None else ProbeTracer(capacity=1, enabled=False)
+        if probe_cache is not None:
+            self.semaphore = probe_cache.semaphore
+        elif semaphore is not None:
+            self.semaphore = semaphore
+        else:
+            self.semaphore = asyncio.Semaphore(semaphore_limit)
         self.good_enough_threshold = good_enough_threshold
 
+    async def probe_ip(self, ip: str) -> List[float]:
+        """Asynchronously measures the round-trip time of each ping attempt to an IP address.
+
+        Parameters:
+        -----------
+        ip : str
+            IP address to test
+
+        Returns:
+        --------
+        List[float]
+            RTT of each attempt (milliseconds), float('inf') for attempts that failed
+        """
+        if self.probe_cache is not None:
+            key = (ip, self.attempts, self.timeout, self.source)
+            return await self.probe_cache.probe(key, lambda: self._ping_attempts(ip))
+        return await self._ping_attempts(ip)
+
+    async def _ping_attempts(self, ip: str) -> List[float]:
+        """Internal method to run the ping attempts for an IP under the concurrency limit."""
+        tracer = self.tracer
+        group = tracer.new_group() if tracer.enabled else 0
+        args = {"ip": ip, "source": self.source} if tracer.enabled else None
+
+        with tracer.span(f"ping {ip}", "probe", group, args):
+            with tracer.span("semaphore_wait", "probe", group):
+                await self.semaphore.acquire()
+
+            try:  # Limit concurrency
+                rtts = []
+
+                for attempt in range(self.attempts):
+                    with tracer.span(f"attempt {attempt + 1}", "probe", group):
+                        rtts.append(await self._ping_once(ip, group))
+            finally:
+                self.semaphore.release()
+
+            if args is not None:
+                args["rtts"] = [rtt if rtt != float("inf") else None for rtt in rtts]
+
+        return rtts
+
+    async def _ping_once(self, ip: str, group: int) -> float:
+        """Internal method to run a single ping, returning its RTT or inf on failure."""
+        tracer = self.tracer
+        try:
+            # Asynchronous version of the system ping command
+            start_time = asyncio.get_event_loop().time()
+
+            command = ["ping", "-c", "1", "-W", str(int(self.timeout * 1000))]
+            if self.source:
+                # Let ping bind its socket to the uplink's address or interface
+                command += ["-I", self.source]
+            command.append(ip)
+
+            with tracer.span("spawn", "probe", group):
+                process = await asyncio.create_subprocess_exec(
+                    *command,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE,
+                )
+
+            with tracer.span("wait", "probe", group):
+                try:
+                    stdout, stderr = await asyncio.wait_for(
+                        process.communicate(), timeout=self.timeout + 0.1
+                    )
+                except (asyncio.TimeoutError, asyncio.CancelledError):
+                    if process.returncode is None:
+                        process.kill()
+                    raise
+
+            if process.returncode != 0:
+                return float("inf")
+
+            with tracer.span("parse", "probe", group):
+                # Parse ping output to get time
+                output = stdout.decode()
+                # Look for latency time in the format time=xx.xx
+                time_match = re.search(r"time[=<](\d+\.?\d*)", output)
+            if time_match:
+                return float(time_match.group(1))
+
+            # If parsing fails, use measured time
+            end_time = asyncio.get_event_loop().time()
+            return (end_time - start_time) * 1000
+
+        except (asyncio.TimeoutError, OSError):
+            # Ping failed or timed out
+            return float("inf")
+
     async def ping_ip(self, ip: str) -> float:
         """Asynchronously tests the latency of a single IP address.
 
@@ -176,177 +1472,486 @@ class AsyncPingTester:
         float
             Average latency (milliseconds), returns float('inf') if unreachable
         """
-        async with self.semaphore:  # Limit concurrency
-            total_time = 0.0
-            successful_pings = 0
-
-            for _ in range(self.attempts):
-                try:
-                    # Asynchronous version of the system ping command
-                    start_time = asyncio.get_event_loop().time()
-
-                    process = await asyncio.create_subprocess_exec(
-                        "ping",
-                        "-c",
-                        "1",
-                        "-W",
-                        str(int(self.timeout * 1000)),
-                        ip,
-                        stdout=asyncio.subprocess.PIPE,
-                        stderr=asyncio.subprocess.PIPE,
-                    )
-
-                    stdout, stderr = await asyncio.wait_for(
-                        process.communicate(), timeout=self.timeout + 0.1
-                    )
-
-                    if process.returncode == 0:
-                        # Parse ping output to get time
-                        output = stdout.decode()
-                        # Look for latency time in the format time=xx.xx
-                        time_match = re.search(r"time[=<](\d+\.?\d*)", output)
-                        if time_match:
-                            ping_time = float(time_match.group(1))
-                            total_time += ping_time
-                            successful_pings += 1
-                        else:
-                            # If parsing fails, use measured time
-                            end_time = asyncio.get_event_loop().time()
-                            measured_time = (end_time - start_time) * 1000
-                            total_time += measured_time
-                            successful_pings += 1
-
-                except (asyncio.TimeoutError, OSError):
-                    # Ping failed or timed out
-                    continue
-
-            if successful_pings == 0:
-                return float("inf")
+        return self._average(await self.probe_ip(ip))
 
-            return total_time / successful_pings
+    @staticmethod
+    def _average(rtts: List[float]) -> float:
+        """Internal method to average the successful attempts (inf if none succeeded)."""
+        successful = [rtt for rtt in rtts if rtt != float("inf")]
+        if not successful:
+            return float("inf")
+        return sum(successful) / len(successful)
+
+    async def find_best_ip(
+        self, candidates: CandidateSet, store: Optional[MeasurementStore] = None
+    ) -> Tuple[str, float]:
+        """Asynchronously selects the IP address with the lowest latency from a candidate set.
 
-    async def find_best_ip(self, ip_file_path: str) -> Tuple[str, float]:
-        """Asynchronously selects the IP address with the lowest latency from a file.
+        The result is the best row of the measurement store (see MeasurementStore.rank), so
+        candidates that lost attempts lose to any candidate that did not.
 
         Parameters:
         -----------
-        ip_file_path : str
-            Path to the file containing IP addresses (one IP per line)
+        candidates : CandidateSet
+            Candidate IP addresses, usually loaded from the CandidateIndex
+        store : Optional[MeasurementStore], default=None
+            Store to record every attempt in; row i must correspond to the i-th candidate
 
         Returns:
         --------
         Tuple[str, float]
             Optimal IP address and its average latency (milliseconds)
-
-        Exceptions:
-        -------
-        FileNotFoundError
-            If the IP file does not exist
         """
-        if not os.path.exists(ip_file_path):
-            raise FileNotFoundError(f"IP file not found: {ip_file_path}")
-
-        # Read all IP addresses
-        ips = []
-        with open(ip_file_path, "r", encoding="utf-8") as file:
-            for line in file:
-                ip = line.strip()
-                if ip and not ip.startswith("#"):  # Skip empty lines and comments
-                    ips.append(ip)
-
-        if not ips:
+        if not candidates:
             return "", float("inf")
 
-        # For a large number of IPs, test the first 20% first, and stop if a good result is found
-        if len(ips) > 50:
-            sample_size = max(10, len(ips) // 5)  # Test at least 10, or 20% of the total
-            sample_ips = ips[:sample_size]
+        if store is None:
+            store = MeasurementStore.from_candidates(candidates, self.attempts)
 
-            best_ip, best_time = await self._test_ip_batch_async(sample_ips)
+        # For a large number of IPs, test the first 20% first, and stop if a good result is found
+        if len(candidates) > 50:
+            sample_size = max(10, len(candidates) // 5)  # Test at least 10, or 20% of the total
 
             # If a good IP is found in the sample (below threshold), do not continue testing
-            if best_time <= self.good_enough_threshold:
-                return best_ip, best_time
-
-            # Otherwise test the remaining IPs
-            remaining_ips = ips[sample_size:]
-            if remaining_ips:
-                remaining_best_ip, remaining_best_time = await self._test_ip_batch_async(
-                    remaining_ips, best_time
+            if not await self._test_ip_batch_async(candidates[:sample_size], store):
+                await self._test_ip_batch_async(
+                    candidates[sample_size:], store, first_row=sample_size
                 )
-
-                if remaining_best_time < best_time:
-                    return remaining_best_ip, remaining_best_time
-
-            return best_ip, best_time
         else:
             # Not many IPs, test all
-            return await self._test_ip_batch_async(ips)
+            await self._test_ip_batch_async(candidates, store)
+
+        return store.best()
 
     async def _test_ip_batch_async(
-        self, ips: List[str], current_best_time: float = float("inf")
-    ) -> Tuple[str, float]:
+        self, ips: CandidateSet, store: MeasurementStore, first_row: int = 0
+    ) -> bool:
         """Internal method to asynchronously test a batch of IP addresses.
 
+        Unless early_exit is disabled, testing stops early once a candidate without lost
+        attempts is below the threshold and at least 'min_results' candidates replied
+        (counting earlier batches).
+
         Parameters:
         -----------
-        ips : List[str]
-            List of IPs to test
-        current_best_time : float
-            Current best time, used for early termination
+        ips : CandidateSet
+            Candidate IPs to test
+        store : MeasurementStore
+            Store to record every attempt in
+        first_row : int, default=0
+            Store row of the first IP in the batch
 
         Returns:
         --------
-        Tuple[str, float]
-            Optimal IP address and its average latency (milliseconds)
+        bool
+            True if testing stopped early
         """
-        best_ip = ""
-        best_time = current_best_time
+        # Account for the candidates earlier batches already measured
+        latency = store.mean_latency()
+        reachable = int(np.count_nonzero(store.measured & np.isfinite(latency)))
+        lossless = store.measured & ~store.lost.any(axis=1)
+        good = int(np.count_nonzero(lossless & (latency <= self.good_enough_threshold)))
 
         # Create all ping tasks
-        tasks = []
-        for ip in ips:
-            task = asyncio.create_task(self.ping_ip(ip))
-            tasks.append((task, ip))
+        tasks = [
+            (asyncio.create_task(self.probe_ip(ip)), row)
+            for row, ip in enumerate(ips, first_row)
+        ]
 
         # Process in batches
-        completed = 0
         batch_size = 20  # Process 20 per batch
 
         for i in range(0, len(tasks), batch_size):
-            batch_tasks = tasks[i : i + batch_size]
+            # Wait for the whole batch, so every finished probe is recorded
+            for task, row in tasks[i : i + batch_size]:
+                try:
+                    rtts = await task
+                except Exception:
+                    # Ignore single IP test errors
+                    continue
 
-            try:
-                # Wait for the current batch to complete
-                for task, ip in batch_tasks:
-                    try:
-                        avg_time = await task
-
-                        if avg_time < best_time:
-                            best_ip = ip
-                            best_time = avg_time
-
-                        completed += 1
-
-                        # If a good enough IP is found, terminate early
-                        if best_time <= self.good_enough_threshold:
-                            # Cancel remaining tasks
-                            for j in range(i + batch_size, len(tasks)):
-                                remaining_task, _ = tasks[j]
-                                if not remaining_task.done():
-                                    remaining_task.cancel()
-                            return best_ip, best_time
-
-                    except Exception:
-                        # Ignore single IP test errors
-                        completed += 1
-                        continue
+                store.record(row, rtts)
+                successful = [rtt for rtt in rtts if rtt != float("inf")]
+                if successful:
+                    reachable += 1
+                    if len(successful) == len(rtts) and (
+                        self._average(rtts) <= self.good_enough_threshold
+                    ):
+                        good += 1
+
+            # If a good enough IP is found, terminate early
+            if self.early_exit and good and reachable >= self.min_results:
+                cancelled = []
+                for task, row in tasks[i + batch_size :]:
+                    if task.done() and not task.cancelled() and task.exception() is None:
+                        store.record(row, task.result())
+                    else:
+                        task.cancel()
+                        cancelled.append(task)
+                # Let cancelled probes unwind, closing their trace spans and ping processes
+                await asyncio.gather(*cancelled, return_exceptions=True)
+                return True
+
+        return False
+
+
+def parse_resolver(resolver: str) -> Tuple[str, int]:
+    """Splits a 'host[:port]' resolver string into an address tuple.
 
-            except Exception:
-                # Ignore batch processing errors
+    Parameters:
+    -----------
+    resolver : str
+        IPv4 address of a DNS resolver, optionally followed by ':port'
+
+    Returns:
+    --------
+    Tuple[str, int]
+        Resolver address and port (53 if not given)
+
+    Exceptions:
+    -------
+    ValueError
+        If the host is not an IPv4 address or the port is invalid. Responses are matched by
+        source address, so hostnames and IPv6 resolvers would never get a reply.
+    """
+    host, sep, port = resolver.rpartition(":")
+    if not sep:
+        host, port = resolver, "53"
+    try:
+        address = ipaddress.IPv4Address(host)
+        port_number = int(port)
+    except ValueError:
+        raise ValueError(f"Invalid DNS resolver (expected 'IPv4[:port]'): '{resolver}'") from None
+    if not 0 < port_number < 0x10000:
+        raise ValueError(f"Invalid DNS resolver port: '{resolver}'")
+    return str(address), port_number
+
+
+def build_dns_query(txid: int, domain: str, ecs_subnet: Optional[str] = None) -> bytes:
+    """Builds a recursive DNS query for the A records of a domain.
+
+    Parameters:
+    -----------
+    txid : int
+        DNS transaction ID
+    domain : str
+        Domain to resolve
+    ecs_subnet : Optional[str], default=None
+        Client subnet (e.g. '58.32.0.0/24') sent as an EDNS Client Subnet option
+
+    Returns:
+    --------
+    bytes
+        DNS message in wire format
+    """
+    header = struct.pack("!HHHHHH", txid, 0x0100, 1, 0, 0, 1 if ecs_subnet else 0)
+    qname = b"".join(
+        bytes([len(label)]) + label for label in domain.rstrip(".").encode("ascii").split(b".")
+    )
+    question = qname + b"\x00" + struct.pack("!HH", DNS_TYPE_A, DNS_CLASS_IN)
+
+    if not ecs_subnet:
+        return header + question
+
+    network = ipaddress.ip_network(ecs_subnet, strict=False)
+    family = 1 if network.version == 4 else 2
+    address = network.network_address.packed[: (network.prefixlen + 7) // 8]
+    option = (
+        struct.pack("!HHHBB", EDNS_OPTION_ECS, 4 + len(address), family, network.prefixlen, 0)
+        + address
+    )
+    # OPT pseudo-record: root name, type OPT, class = UDP payload size, TTL = 0
+    opt_record = b"\x00" + struct.pack("!HHIH", DNS_TYPE_OPT, 4096, 0, len(option)) + option
+    return header + question + opt_record
+
+
+def _skip_dns_name(data: bytes, offset: int) -> int:
+    """Returns the offset just past a (possibly compressed) domain name."""
+    while True:
+        length = data[offset]
+        if length == 0:
+            return offset + 1
+        if length & 0xC0 == 0xC0:  # Compression pointer ends the name
+            return offset + 2
+        offset += length + 1
+
+
+def parse_dns_response(data: bytes) -> Tuple[int, List[str]]:
+    """Extracts the A records from a DNS response.
+
+    CNAME records in the answer section are skipped, so the addresses at the end
+    of a CNAME chain are returned.
+
+    Parameters:
+    -----------
+    data : bytes
+        DNS message in wire format
+
+    Returns:
+    --------
+    Tuple[int, List[str]]
+        Transaction ID and IPv4 addresses (empty if the resolver reported an error)
+
+    Exceptions:
+    -------
+    ValueError
+        If the message is malformed
+    """
+    try:
+        txid, flags, qdcount, ancount = struct.unpack_from("!HHHH", data)
+        if flags & 0x000F:  # Non-zero RCODE (NXDOMAIN, SERVFAIL, ...)
+            return txid, []
+
+        offset = 12
+        for _ in range(qdcount):
+            offset = _skip_dns_name(data, offset) + 4
+
+        addresses = []
+        for _ in range(ancount):
+            offset = _skip_dns_name(data, offset)
+            rtype, rclass, _, rdlength = struct.unpack_from("!HHIH", data, offset)
+            offset += 10
+            if offset + rdlength > len(data):
+                raise ValueError("Malformed DNS response: record exceeds message")
+            if rtype == DNS_TYPE_A and rclass == DNS_CLASS_IN and rdlength == 4:
+                addresses.append(socket.inet_ntoa(data[offset : offset + 4]))
+            offset += rdlength
+    except (struct.error, IndexError) as e:
+        raise ValueError(f"Malformed DNS response: {e}")
+
+    return txid, addresses
+
+
+class _DnsClientProtocol(asyncio.DatagramProtocol):
+    """UDP endpoint that pipelines many DNS queries over a single socket.
+
+    Outstanding queries are matched to responses by (transaction ID, resolver address).
+    """
+
+    def __init__(self):
+        self.transport: Optional[asyncio.DatagramTransport] = None
+        self.pending: Dict[Tuple[int, Tuple[str, int]], asyncio.Future] = {}
+        self._next_txid = random.randrange(0x10000)
+
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, addr: Tuple) -> None:
+        try:
+            txid, addresses = parse_dns_response(data)
+        except ValueError:
+            return
+
+        future = self.pending.pop((txid, addr[:2]), None)
+        if future is not None and not future.done():
+            future.set_result(addresses)
+
+    def error_received(self, exc: Exception) -> None:
+        # ICMP errors cannot be tied to a query; affected queries simply time out
+        pass
+
+    def connection_lost(self, exc: Optional[Exception]) -> None:
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError("DNS socket closed"))
+        self.pending.clear()
+
+    def send_query(
+        self, domain: str, resolver: Tuple[str, int], ecs_subnet: Optional[str]
+    ) -> asyncio.Future:
+        """Sends a query and returns a future resolved with the response's A records."""
+        txid = self._next_txid
+        while (txid, resolver) in self.pending:
+            txid = (txid + 1) & 0xFFFF
+        self._next_txid = (txid + 1) & 0xFFFF
+
+        future = asyncio.get_running_loop().create_future()
+        self.pending[(txid, resolver)] = future
+        self.transport.sendto(build_dns_query(txid, domain, ecs_subnet), resolver)
+        return future
+
+    def forget(self, future: asyncio.Future) -> None:
+        """Drops a query that timed out so a late response is ignored."""
+        for key, pending_future in list(self.pending.items()):
+            if pending_future is future:
+                del self.pending[key]
+                return
+
+
+class DnsCandidateDiscoverer:
+    """Discovers candidate IP addresses by resolving service domains against many resolvers.
+
+    Every (domain, resolver, client subnet) combination is queried concurrently. Queries are
+    pipelined over a small pool of UDP sockets and matched to responses by transaction ID.
+
+    Parameters:
+    -----------
+    resolvers : List[str]
+        DNS resolvers as IPv4 addresses, optionally with ':port'
+    ecs_subnets : List[Optional[str]], default=[None]
+        EDNS client subnets to vary the queries with (None sends no ECS option)
+    timeout : float, default=2.0
+        Timeout for each DNS query (seconds)
+    pool_size : int, default=4
+        Number of UDP sockets queries are spread over
+    retries : int, default=1
+        Number of times a timed-out query is resent
+    max_in_flight : int, default=256
+        Maximum number of outstanding queries
+    """
+
+    def __init__(
+        self,
+        resolvers: List[str],
+        ecs_subnets: Optional[List[Optional[str]]] = None,
+        timeout: float = 2.0,
+        pool_size: int = 4,
+        retries: int = 1,
+        max_in_flight: int = 256,
+    ):
+        self.resolvers = [parse_resolver(resolver) for resolver in resolvers]
+        self.ecs_subnets = ecs_subnets or [None]
+        self.timeout = timeout
+        self.pool_size = max(1, pool_size)
+        self.retries = retries
+        self.max_in_flight = max_in_flight
+
+    async def resolve_domains(self, domains: Iterable[str]) -> Dict[str, Set[str]]:
+        """Resolves domains against every resolver and client subnet.
+
+        Parameters:
+        -----------
+        domains : Iterable[str]
+            Domains to resolve
+
+        Returns:
+        --------
+        Dict[str, Set[str]]
+            Dictionary of domains to every A record returned for them
+        """
+        domains = list(dict.fromkeys(domains))
+        results: Dict[str, Set[str]] = {domain: set() for domain in domains}
+        if not domains or not self.resolvers:
+            return results
+
+        loop = asyncio.get_running_loop()
+        pool = []
+        try:
+            for _ in range(self.pool_size):
+                _, protocol = await loop.create_datagram_endpoint(
+                    _DnsClientProtocol, local_addr=("0.0.0.0", 0)
+                )
+                pool.append(protocol)
+
+            semaphore = asyncio.Semaphore(self.max_in_flight)
+            queries = [
+                (domain, resolver, ecs_subnet)
+                for domain in domains
+                for resolver in self.resolvers
+                for ecs_subnet in self.ecs_subnets
+            ]
+            answers = await asyncio.gather(
+                *(
+                    self._query(pool[i % len(pool)], semaphore, *query)
+                    for i, query in enumerate(queries)
+                )
+            )
+            for (domain, _, _), addresses in zip(queries, answers):
+                results[domain].update(addresses)
+        finally:
+            for protocol in pool:
+                if protocol.transport is not None:
+                    protocol.transport.close()
+
+        return results
+
+    async def _query(
+        self,
+        protocol: _DnsClientProtocol,
+        semaphore: asyncio.Semaphore,
+        domain: str,
+        resolver: Tuple[str, int],
+        ecs_subnet: Optional[str],
+    ) -> List[str]:
+        """Internal method to send one query, resending it on timeout."""
+        async with semaphore:
+            for _ in range(self.retries + 1):
+                future = protocol.send_query(domain, resolver, ecs_subnet)
+                try:
+                    return await asyncio.wait_for(future, timeout=self.timeout)
+                except asyncio.TimeoutError:
+                    protocol.forget(future)
+                except (ConnectionError, OSError):
+                    return []
+        return []
+
+    async def discover(
+        self, services: Dict[str, ServiceConfig], write_mode: str = "sidecar"
+    ) -> Dict[str, Tuple[int, int]]:
+        """Resolves all service domains and merges new A records into the candidate files.
+
+        Parameters:
+        -----------
+        services : Dict[str, ServiceConfig]
+            Dictionary of service keys to configurations
+        write_mode : str, default='sidecar'
+            'sidecar' writes new IPs to the service's '*.discovered.txt' file,
+            'inplace' appends them to the service's IP file
+
+        Returns:
+        --------
+        Dict[str, Tuple[int, int]]
+            Dictionary of service keys to (new IPs added, total candidates)
+
+        Exceptions:
+        -------
+        ValueError
+            If write_mode is not 'sidecar' or 'inplace'
+        """
+        if write_mode not in ("sidecar", "inplace"):
+            raise ValueError(f"Unknown DNS write mode: {write_mode}")
+
+        resolved = await self.resolve_domains(
+            domain for config in services.values() for domain in config.domains
+        )
+
+        summary = {}
+        for service_key, config in services.items():
+            if not config.domains:
                 continue
 
-        return best_ip, best_time
+            known = read_candidate_ips(config.ip_file_path)
+            known_set = set(known)
+            new_ips = sorted(
+                {ip for domain in config.domains for ip in resolved.get(domain, ())} - known_set,
+                key=lambda ip: ipaddress.ip_address(ip),
+            )
+
+            if new_ips:
+                target = (
+                    config.ip_file_path
+                    if write_mode == "inplace"
+                    else discovered_file_path(config.ip_file_path)
+                )
+                self._append_ips(target, new_ips)
+
+            summary[service_key] = (len(new_ips), len(known) + len(new_ips))
+
+        return summary
+
+    @staticmethod
+    def _append_ips(path: str, ips: List[str]) -> None:
+        """Internal method to append IPs to a file, one per line."""
+        needs_newline = False
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path, "rb") as file:
+                file.seek(-1, os.SEEK_END)
+                needs_newline = file.read(1) != b"\n"
+
+        with open(path, "a", encoding="utf-8") as file:
+            if needs_newline:
+                file.write("\n")
+            file.write("\n".join(ips) + "\n")
 
 
 class ConfigurationManager:
@@ -358,10 +1963,13 @@ class ConfigurationManager:
     -----------
     data_dir : str, default='./data'
         Directory where IP address files are stored
+    service_keys : Optional[List[str]], default=None
+        Dynamic services to load (all configured services if None)
     """
 
-    def __init__(self, data_dir: str = "./data"):
+    def __init__(self, data_dir: str = "./data", service_keys: Optional[List[str]] = None):
         self.data_dir = data_dir
+        self.service_keys = service_keys
 
     def load_dynamic_services(self) -> Dict[str, ServiceConfig]:
         """Loads dynamic services from configuration.
@@ -374,6 +1982,8 @@ class ConfigurationManager:
         services = {}
 
         for service_key, config in DYNAMIC_SERVICES.items():
+            if self.service_keys is not None and service_key not in self.service_keys:
+                continue
             ip_file_path = os.path.join(self.data_dir, config["ip_file"])
             services[service_key] = ServiceConfig(
                 name=config["name"], ip_file_path=ip_file_path, domains=config["domains"]
@@ -506,27 +2116,87 @@ class MicrosoftHostsPicker:
     -----------
     config : Dict, optional
         Configuration dictionary. Uses DEFAULT_CONFIG if None
+    reporter : Logger, optional
+        Receives progress output. Uses a console Logger if None
+    probe_cache : ProbeCache, optional
+        Probe layer shared with other pickers (see pick_profiles)
+    tracer : ProbeTracer, optional
+        Tracer shared with other pickers. If None, the picker creates and writes its own
+        when the 'trace_file' setting is given
     """
 
-    def __init__(self, config: Optional[Dict] = None):
+    def __init__(
+        self,
+        config: Optional[Dict] = None,
+        reporter: Optional[Logger] = None,
+        probe_cache: Optional[ProbeCache] = None,
+        tracer: Optional[ProbeTracer] = None,
+    ):
         if config is None:
             config = DEFAULT_CONFIG
 
         self.config = config
+        self.reporter = reporter if reporter is not None else Logger()
+        self._owns_tracer = tracer is None
+        if tracer is None:
+            tracer = ProbeTracer(
+                capacity=config.get("trace_buffer_size", 200_000),
+                enabled=bool(config.get("trace_file")),
+            )
+        self.tracer = tracer
         # Use asynchronous ping tester
-        self.ping_tester = AsyncPingTester(
-            attempts=config.get("ping_attempts", 2),
-            timeout=config.get("ping_timeout", 0.5),
-            semaphore_limit=config.get("ping_max_workers", 50),
-            good_enough_threshold=config.get("good_enough_threshold", 50.0),
+        self.ping_tester = self._create_tester(probe_cache)
+        # One tester per configured uplink; all of them probe every candidate concurrently,
+        # under the same 'ping_max_workers' limit
+        self.uplink_testers = {
+            source: self._create_tester(probe_cache, source, self.ping_tester.semaphore)
+            for source in config.get("source_addresses") or []
+        }
+        self.config_manager = ConfigurationManager(
+            data_dir=config.get("data_directory", "./data"),
+            service_keys=config.get("services"),
         )
-        self.config_manager = ConfigurationManager(data_dir=config.get("data_directory", "./data"))
         self.hosts_generator = HostsFileGenerator(output_file=config.get("output_file", "hosts"))
+        self.candidate_index = CandidateIndex(
+            config.get("candidate_index_file")
+            or os.path.join(config.get("data_directory", "./data"), "candidates.idx")
+        )
+        # Per-service measurements of the last test run, used for ranking and shortlists
+        self.measurements: Dict[str, MeasurementStore] = {}
+        # Per-uplink measurements and results of the last test run
+        self.uplink_measurements: Dict[str, Dict[str, MeasurementStore]] = {}
+        self.uplink_results: Dict[str, Dict[str, Tuple[str, float]]] = {}
+        self.seed_snapshot: Optional[MeasurementSnapshot] = None
+        self._failed_services: Set[str] = set()
+
+    def _create_tester(
+        self,
+        probe_cache: Optional[ProbeCache],
+        source: Optional[str] = None,
+        semaphore: Optional[asyncio.Semaphore] = None,
+    ) -> AsyncPingTester:
+        """Internal method to create a ping tester from the configuration."""
+        return AsyncPingTester(
+            attempts=self.config.get("ping_attempts", 2),
+            timeout=self.config.get("ping_timeout", 0.5),
+            semaphore_limit=self.config.get("ping_max_workers", 50),
+            good_enough_threshold=self.config.get("good_enough_threshold", 50.0),
+            probe_cache=probe_cache,
+            tracer=self.tracer,
+            source=source,
+            # Keep measuring until the shortlist for later stages can be filled
+            min_results=self.config.get("shortlist_size", 5),
+            # Snapshots feed fleet merges and seeding, so they need every candidate measured
+            early_exit=not self.config.get("snapshot_export"),
+            semaphore=semaphore,
+        )
 
     async def test_services(self) -> Dict[str, Tuple[str, float]]:
         """Tests all dynamic services and selects the optimal IP.
 
-        Uses sequential testing for cleaner, more readable output.
+        Uses sequential testing for cleaner, more readable output. With 'source_addresses'
+        configured, each service is tested over all uplinks at once; the per-uplink results
+        are kept in uplink_results and the fastest uplink's result is returned.
 
         Returns:
         --------
@@ -536,10 +2206,10 @@ class MicrosoftHostsPicker:
         services = self.config_manager.load_dynamic_services()
 
         if not services:
-            Logger.warning("No dynamic services configured for testing")
+            self.reporter.warning("No dynamic services configured for testing")
             return {}
 
-        Logger.section(f"Testing {len(services)} Microsoft services")
+        self.reporter.section(f"Testing {len(services)} Microsoft services")
 
         # Record start time
         start_time = time.time()
@@ -550,41 +2220,275 @@ class MicrosoftHostsPicker:
             if os.path.exists(config.ip_file_path):
                 valid_services.append((service_key, config))
             else:
-                Logger.warning(f"IP file does not exist: {config.name} -> {config.ip_file_path}")
+                self.reporter.warning(
+                    f"IP file does not exist: {config.name} -> {config.ip_file_path}"
+                )
+
+        # Map the compiled candidate index, rebuilding it if any IP file changed. It covers
+        # all configured services so pickers testing different subsets can share it.
+        all_services = ConfigurationManager(self.config_manager.data_dir).load_dynamic_services()
+        self.candidate_index.load(
+            {
+                service_key: config
+                for service_key, config in all_services.items()
+                if os.path.exists(config.ip_file_path)
+            }
+        )
+
+        # Probe only the fleet's best candidates when seeded from a merged snapshot
+        seed_path = self.config.get("seed_snapshot")
+        if seed_path:
+            try:
+                self.seed_snapshot = MeasurementSnapshot.load(seed_path)
+            except ValueError as e:
+                self.reporter.warning(f"Ignoring seed snapshot: {e}")
 
         results = {}
+        self.measurements = {}
+        self.uplink_measurements = {source: {} for source in self.uplink_testers}
+        self.uplink_results = {source: {} for source in self.uplink_testers}
+        self._failed_services = set()
         total_services = len(valid_services)
 
         # Test services sequentially for clean output
         for i, (service_key, config) in enumerate(valid_services, 1):
-            Logger.service_start(config.name, total_services, i)
+            self.reporter.service_start(config.name, total_services, i)
             
             try:
-                ip, latency = await self.ping_tester.find_best_ip(config.ip_file_path)
+                candidates = self._load_candidates(service_key)
+                span_args = {"profile": self.config.get("profile_name", "default")}
+                with self.tracer.span(config.name, "service", self.tracer.new_group(), span_args):
+                    if self.uplink_testers:
+                        ip, latency = await self._test_uplinks(service_key, candidates)
+                    else:
+                        store = MeasurementStore.from_candidates(
+                            candidates, self.ping_tester.attempts
+                        )
+                        self.measurements[service_key] = store
+                        ip, latency = await self.ping_tester.find_best_ip(candidates, store)
                 results[service_key] = (ip, latency)
 
                 if ip:
-                    Logger.service_result(
+                    self.reporter.service_result(
                         config.name, ip, latency, total_services, i, "success"
                     )
                 else:
-                    Logger.service_result(
+                    self.reporter.service_result(
                         config.name, "", 0, total_services, i, "no_ip"
                     )
 
             except Exception:
-                Logger.service_result(
+                self.reporter.service_result(
                     config.name, "", 0, total_services, i, "error"
                 )
                 results[service_key] = ("", float("inf"))
+                for uplink_results in self.uplink_results.values():
+                    uplink_results[service_key] = ("", float("inf"))
+                self._failed_services.add(service_key)
 
         # Calculate total time
         total_time = time.time() - start_time
-        Logger.completion_summary(total_time)
+        self.reporter.completion_summary(total_time)
 
         return results
 
-        return results
+    async def _test_uplinks(self, service_key: str, candidates: CandidateSet) -> Tuple[str, float]:
+        """Internal method to test a service's candidates over every uplink concurrently.
+
+        Each uplink ranks the candidates in its own store. The fastest uplink's store becomes
+        the service's measurements, so shortlists and snapshots follow the best route.
+        """
+        stores = {
+            source: MeasurementStore.from_candidates(candidates, tester.attempts)
+            for source, tester in self.uplink_testers.items()
+        }
+        outcomes = await asyncio.gather(
+            *(
+                tester.find_best_ip(candidates, stores[source])
+                for source, tester in self.uplink_testers.items()
+            )
+        )
+
+        for source, (ip, latency) in zip(self.uplink_testers, outcomes):
+            self.uplink_measurements[source][service_key] = stores[source]
+            self.uplink_results[source][service_key] = (ip, latency)
+            self.reporter.uplink_result(source, ip, latency)
+
+        best = min(
+            self.uplink_testers, key=lambda source: self.uplink_results[source][service_key][1]
+        )
+        self.measurements[service_key] = stores[best]
+        return self.uplink_results[best][service_key]
+
+    async def discover_candidates(self) -> Dict[str, Tuple[int, int]]:
+        """Grows the candidate IP pools by resolving service domains over DNS.
+
+        Returns:
+        --------
+        Dict[str, Tuple[int, int]]
+            Dictionary of service keys to (new IPs added, total candidates)
+        """
+        services = {
+            service_key: config
+            for service_key, config in self.config_manager.load_dynamic_services().items()
+            if config.domains and os.path.exists(config.ip_file_path)
+        }
+        resolvers = self.config.get("dns_resolvers", [])
+        if not services or not resolvers:
+            return {}
+
+        self.reporter.section(f"Discovering candidate IPs via {len(resolvers)} DNS resolvers")
+
+        discoverer = DnsCandidateDiscoverer(
+            resolvers=resolvers,
+            ecs_subnets=self.config.get("dns_ecs_subnets", [None]),
+            timeout=self.config.get("dns_timeout", 2.0),
+            pool_size=self.config.get("dns_socket_pool_size", 4),
+        )
+        summary = await discoverer.discover(
+            services, write_mode=self.config.get("dns_write_mode", "sidecar")
+        )
+
+        for service_key, (added, total) in summary.items():
+            self.reporter.discovery_result(services[service_key].name, added, total)
+
+        return summary
+
+    def _load_candidates(self, service_key: str) -> CandidateSet:
+        """Internal method to get the candidates to probe for a service.
+
+        Uses the top 'seed_top_n' IPs of the seed snapshot, in rank order, if it ranks any
+        for the service; otherwise all candidates from the index.
+        """
+        if self.seed_snapshot is not None:
+            ranked = self.seed_snapshot.rank(service_key)
+            if ranked:
+                top_n = self.config.get("seed_top_n", 20)
+                return CandidateSet.from_ips(ip for ip, _ in ranked[:top_n])
+        return self.candidate_index.get(service_key)
+
+    def export_snapshot(self, path: str, source: Optional[str] = None) -> MeasurementSnapshot:
+        """Writes the measurements of the last test run as a snapshot.
+
+        Parameters:
+        -----------
+        path : str
+            Output file path (conventionally '*.json.gz')
+        source : Optional[str], default=None
+            Uplink from 'source_addresses' to export; its node label gets an '@<source>'
+            suffix so fleet merges can tell routes apart
+
+        Returns:
+        --------
+        MeasurementSnapshot
+            The exported snapshot
+        """
+        node = self.config.get("node_name") or socket.gethostname()
+        snapshot = MeasurementSnapshot.from_stores(
+            node=node if source is None else f"{node}@{source}",
+            site=self.config.get("site", "default"),
+            stores=self.measurements if source is None else self.uplink_measurements[source],
+        )
+        snapshot.save(path)
+        return snapshot
+
+    def merge_snapshots(
+        self, paths: List[str], by_site: bool = False, save_path: Optional[str] = None
+    ) -> Dict[str, MeasurementSnapshot]:
+        """Merges snapshots from many nodes and writes a hosts file per site or globally.
+
+        Parameters:
+        -----------
+        paths : List[str]
+            Snapshot files to merge
+        by_site : bool, default=False
+            Merge each site separately; output files get a '.<site>' suffix
+        save_path : Optional[str], default=None
+            Also write the merged snapshot(s) to this path
+
+        Returns:
+        --------
+        Dict[str, MeasurementSnapshot]
+            Dictionary of site labels ('global' unless by_site) to merged snapshots
+        """
+        snapshots = [MeasurementSnapshot.load(path) for path in paths]
+        groups: Dict[str, List[MeasurementSnapshot]] = {}
+        for snapshot in snapshots:
+            groups.setdefault(snapshot.site if by_site else "global", []).append(snapshot)
+
+        dynamic_services = self.config_manager.load_dynamic_services()
+        output_file = self.config.get("output_file", "hosts")
+        merged = {}
+
+        for site, members in groups.items():
+            snapshot = MeasurementSnapshot.merge(members, site=site)
+            merged[site] = snapshot
+            nodes = ", ".join(sorted({member.node for member in members}))
+            self.reporter.section(f"Site '{site}': {len(members)} snapshots ({nodes})")
+
+            results = {}
+            service_keys = [key for key in snapshot.services if key in dynamic_services]
+            for i, service_key in enumerate(service_keys, 1):
+                ranked = snapshot.rank(service_key)
+                ip, latency = ranked[0] if ranked else ("", float("inf"))
+                results[service_key] = (ip, latency)
+                self.reporter.service_result(
+                    dynamic_services[service_key].name,
+                    ip,
+                    latency,
+                    len(service_keys),
+                    i,
+                    "success" if ip else "no_ip",
+                )
+
+            self._write_hosts_file(
+                results, _site_path(output_file, site) if by_site else output_file
+            )
+
+            if save_path:
+                snapshot_path = _site_path(save_path, site) if by_site else save_path
+                snapshot.save(snapshot_path)
+                self.reporter.snapshot_generated(snapshot_path)
+
+        return merged
+
+    def _write_hosts_file(self, test_results: Dict[str, Tuple[str, float]], path: str) -> None:
+        """Internal method to generate a hosts file from test results and write it to a path."""
+        self.generate_hosts_file(test_results)
+        default_path = self.hosts_generator.output_file
+        self.hosts_generator.output_file = path
+        try:
+            self.hosts_generator.write_file()
+        finally:
+            self.hosts_generator.output_file = default_path
+        self.reporter.file_generated(path)
+
+    def get_shortlist(
+        self, service_key: str, k: Optional[int] = None, source: Optional[str] = None
+    ) -> List[Tuple[str, float]]:
+        """Returns the best measured candidates of a service for later probing stages.
+
+        Parameters:
+        -----------
+        service_key : str
+            Service key from DYNAMIC_SERVICES
+        k : Optional[int], default=None
+            Number of candidates, defaults to the 'shortlist_size' setting
+        source : Optional[str], default=None
+            Uplink from 'source_addresses' to rank for (the fastest uplink's view if None)
+
+        Returns:
+        --------
+        List[Tuple[str, float]]
+            (IP address, mean latency in milliseconds), best first
+        """
+        measurements = self.measurements if source is None else self.uplink_measurements[source]
+        store = measurements.get(service_key)
+        if store is None:
+            return []
+        if k is None:
+            k = self.config.get("shortlist_size", 5)
+        return store.shortlist(k)
 
     def generate_hosts_file(self, test_results: Dict[str, Tuple[str, float]]) -> None:
         """Generates the hosts file based on the optimal IPs.
@@ -629,7 +2533,7 @@ class MicrosoftHostsPicker:
         data_dir = self.config.get("data_directory", "./data")
 
         if not os.path.exists(data_dir):
-            Logger.error(f"Data directory does not exist: '{data_dir}'")
+            self.reporter.error(f"Data directory does not exist: '{data_dir}'")
             return False
 
         # Check if at least some IP files exist
@@ -640,76 +2544,432 @@ class MicrosoftHostsPicker:
             if os.path.exists(config.ip_file_path):
                 existing_files += 1
             else:
-                Logger.warning(f"IP file does not exist: {config.name} -> {config.ip_file_path}")
+                self.reporter.warning(
+                    f"IP file does not exist: {config.name} -> {config.ip_file_path}"
+                )
 
         if existing_files == 0:
-            Logger.error("No valid IP files found")
+            self.reporter.error("No valid IP files found")
             return False
 
-        print(f"✅ Configuration validated: {existing_files} services ready")
+        for source in self.uplink_testers:
+            if not _source_available(source):
+                self.reporter.error(f"Source address or interface is not available: '{source}'")
+                return False
+
+        self.reporter.info(f"✅ Configuration validated: {existing_files} services ready")
         return True
 
-    async def run(self) -> None:
-        """Executes the complete Microsoft Hosts Picker process.
+    async def pick(self) -> PickResult:
+        """Runs the complete process without user interaction and returns the results.
 
         This method includes:
         1. Validating the configuration
-        2. Testing the optimal IP for all Microsoft services
-        3. Generating the hosts file
-        4. Providing user feedback and usage instructions
+        2. Discovering new candidate IPs over DNS (if enabled)
+        3. Testing the optimal IP for all Microsoft services
+        4. Generating and writing the hosts file (and measurement snapshot, if configured)
+
+        Errors are reported through the result rather than raised.
+
+        Returns:
+        --------
+        PickResult
+            Per-service results and hosts content; 'error' is set if the run failed
         """
-        Logger.header("Microsoft Hosts Picker")
+        start_time = time.time()
+        try:
+            return await self._pick(start_time)
+        except Exception as e:
+            return self._failed(f"An unexpected error occurred: {e}", start_time)
+
+    def _failed(
+        self,
+        message: str,
+        start_time: float,
+        services: Optional[Dict[str, ServiceResult]] = None,
+    ) -> PickResult:
+        """Internal method to report an error and return it as a failed PickResult."""
+        self.reporter.error(message)
+        return PickResult(
+            profile=self.config.get("profile_name", "default"),
+            services=services or {},
+            hosts_content="",
+            output_file=None,
+            elapsed=time.time() - start_time,
+            error=message,
+        )
+
+    async def _pick(self, start_time: float) -> PickResult:
+        """Internal method implementing pick(); unexpected exceptions propagate."""
+        profile = self.config.get("profile_name", "default")
+
+        def failed(message: str, services: Optional[Dict[str, ServiceResult]] = None):
+            return self._failed(message, start_time, services)
 
         # Validate configuration
         if not self.validate_configuration():
-            Logger.error("Configuration validation failed, please check the configuration")
-            return
+            return failed("Configuration validation failed, please check the configuration")
+
+        # Grow candidate pools from DNS before testing
+        if self.config.get("dns_discovery", False):
+            try:
+                await self.discover_candidates()
+            except (OSError, ValueError) as e:
+                self.reporter.warning(f"DNS candidate discovery failed: {e}")
 
         # Test dynamic services
         test_results = await self.test_services()
+        services = self._service_results(test_results)
+        uplinks = {
+            source: self._service_results(results, source)
+            for source, results in self.uplink_results.items()
+        }
+
+        if self._owns_tracer:
+            self._write_trace(self.config.get("trace_file"))
 
         if not test_results:
-            Logger.error("Testing of all services failed")
-            return
+            return failed("Testing of all services failed", services)
 
         # Generate hosts file
-        Logger.section("Generating Hosts File")
+        self.reporter.section("Generating Hosts File")
         self.generate_hosts_file(test_results)
 
         try:
             self.hosts_generator.write_file()
-            Logger.file_generated(self.hosts_generator.output_file)
+            self.reporter.file_generated(self.hosts_generator.output_file)
         except IOError as e:
-            Logger.error(f"Failed to write hosts file: {e}")
+            return failed(f"Failed to write hosts file: {e}", services)
+        hosts_content = self.hosts_generator.get_content()
+
+        # Write a hosts file per uplink, for routing each uplink's traffic separately
+        for source, results in self.uplink_results.items():
+            path = _site_path(self.hosts_generator.output_file, _uplink_label(source))
+            try:
+                self._write_hosts_file(results, path)
+            except IOError as e:
+                self.reporter.error(f"Failed to write hosts file for uplink '{source}': {e}")
+
+        # Export measurements for fleet merging
+        snapshot_path = self.config.get("snapshot_export")
+        if snapshot_path:
+            # With several uplinks, export each route separately rather than a mix of them
+            exports = {
+                _site_path(snapshot_path, _uplink_label(source)): source
+                for source in self.uplink_results
+            } or {snapshot_path: None}
+            for path, source in exports.items():
+                try:
+                    self.export_snapshot(path, source)
+                    self.reporter.snapshot_generated(path)
+                except OSError as e:
+                    self.reporter.error(f"Failed to write measurement snapshot: {e}")
+
+        return PickResult(
+            profile=profile,
+            services=services,
+            hosts_content=hosts_content,
+            output_file=self.hosts_generator.output_file,
+            elapsed=time.time() - start_time,
+            uplinks=uplinks,
+        )
+
+    def _write_trace(self, path: Optional[str]) -> None:
+        """Internal method to write the probe trace, if tracing is enabled."""
+        if not path or not self.tracer.enabled:
             return
+        try:
+            spans = self.tracer.write(path)
+            self.reporter.trace_generated(path, spans)
+        except OSError as e:
+            self.reporter.error(f"Failed to write probe trace: {e}")
+
+    def _service_results(
+        self, test_results: Dict[str, Tuple[str, float]], source: Optional[str] = None
+    ) -> Dict[str, ServiceResult]:
+        """Internal method to turn raw test results into ServiceResult objects."""
+        dynamic_services = self.config_manager.load_dynamic_services()
+        results = {}
+        for service_key, (ip, latency) in test_results.items():
+            config = dynamic_services[service_key]
+            if service_key in self._failed_services:
+                status = "error"
+            else:
+                status = "success" if ip else "no_ip"
+            results[service_key] = ServiceResult(
+                key=service_key,
+                name=config.name,
+                domains=config.domains,
+                ip=ip,
+                latency=latency,
+                status=status,
+                shortlist=self.get_shortlist(service_key, source=source),
+            )
+        return results
+
+    async def run(self) -> PickResult:
+        """Executes the complete Microsoft Hosts Picker process with console feedback.
+
+        Prints a header before and usage instructions after pick().
+
+        Returns:
+        --------
+        PickResult
+            Per-service results and hosts content
+        """
+        self.reporter.header("Microsoft Hosts Picker")
+        result = await self.pick()
 
         # Provide completion feedback
-        Logger.usage_instructions()
+        if result.ok:
+            self.reporter.usage_instructions()
+        return result
 
-        input("\n🎯 Press Enter to exit...")
 
+async def pick_profiles(
+    profiles: List[Dict],
+    config: Optional[Dict] = None,
+    reporter: Optional[Logger] = None,
+) -> Dict[str, PickResult]:
+    """Evaluates several output profiles in one process, sharing a single probe layer.
 
-async def main():
+    Each profile is a dictionary of configuration overrides (e.g. 'services',
+    'good_enough_threshold', 'output_file') applied on top of config, plus a 'name'.
+    Profiles run concurrently on the same event loop; candidates they have in common
+    are measured once. DNS discovery, if enabled, runs once before the profiles. A
+    'snapshot_export' path inherited from config gets a '.<name>' suffix per profile,
+    and output lines are prefixed with the profile name.
+
+    Parameters:
+    -----------
+    profiles : List[Dict]
+        Profile definitions
+    config : Optional[Dict], default=None
+        Base configuration. Uses DEFAULT_CONFIG if None
+    reporter : Optional[Logger], default=None
+        Receives progress output of all profiles. Uses a console Logger if None
+
+    Returns:
+    --------
+    Dict[str, PickResult]
+        Dictionary of profile names to results; a failed profile does not affect the others
+
+    Exceptions:
+    -------
+    ValueError
+        If two profiles share a name, output file or snapshot path
+    """
+    base_config = dict(DEFAULT_CONFIG if config is None else config)
+    reporter = reporter if reporter is not None else Logger()
+
+    names = [profile.get("name", f"profile_{i}") for i, profile in enumerate(profiles, 1)]
+    outputs = [profile.get("output_file", base_config.get("output_file")) for profile in profiles]
+    # Profiles would overwrite each other's snapshot, so an inherited path gets the name
+    snapshots = []
+    for name, profile in zip(names, profiles):
+        path = profile.get("snapshot_export")
+        if "snapshot_export" not in profile and base_config.get("snapshot_export"):
+            path = _site_path(base_config["snapshot_export"], name)
+        snapshots.append(path)
+    exported = [path for path in snapshots if path]
+    if (
+        len(set(names)) != len(names)
+        or len(set(outputs)) != len(outputs)
+        or len(set(exported)) != len(exported)
+    ):
+        raise ValueError("Profiles must have distinct names, output files and snapshot paths")
+
+    probe_cache = ProbeCache(base_config.get("ping_max_workers", 50))
+    trace_file = base_config.get("trace_file")
+    tracer = ProbeTracer(
+        capacity=base_config.get("trace_buffer_size", 200_000), enabled=bool(trace_file)
+    )
+
+    if base_config.get("dns_discovery", False):
+        try:
+            await MicrosoftHostsPicker(base_config, reporter).discover_candidates()
+        except (OSError, ValueError) as e:
+            reporter.warning(f"DNS candidate discovery failed: {e}")
+
+    pickers = []
+    for name, profile, snapshot_path in zip(names, profiles, snapshots):
+        profile_config = {
+            **base_config,
+            **profile,
+            "profile_name": name,
+            "snapshot_export": snapshot_path,
+            "dns_discovery": False,
+        }
+        profile_config.pop("name", None)
+        profile_reporter = reporter.with_prefix(f"[{name}] ")
+        pickers.append(MicrosoftHostsPicker(profile_config, profile_reporter, probe_cache, tracer))
+
+    reporter.header(f"Microsoft Hosts Picker - {len(pickers)} profiles")
+    outcomes = await asyncio.gather(
+        *(picker.pick() for picker in pickers), return_exceptions=True
+    )
+    results = []
+    for name, outcome in zip(names, outcomes):
+        if isinstance(outcome, Exception):
+            message = f"An unexpected error occurred: {outcome}"
+            reporter.with_prefix(f"[{name}] ").error(message)
+            outcome = PickResult(
+                profile=name,
+                services={},
+                hosts_content="",
+                output_file=None,
+                elapsed=0.0,
+                error=message,
+            )
+        results.append(outcome)
+    if tracer.enabled:
+        try:
+            reporter.trace_generated(trace_file, tracer.write(trace_file))
+        except OSError as e:
+            reporter.error(f"Failed to write probe trace: {e}")
+    return {result.profile: result for result in results}
+
+
+def _site_path(path: str, site: str) -> str:
+    """Inserts a site label after the base name of a path ('hosts' -> 'hosts.<site>')."""
+    directory, name = os.path.split(path)
+    base, dot, extension = name.partition(".")
+    return os.path.join(directory, f"{base}.{site}{dot}{extension}")
+
+
+def _uplink_label(source: str) -> str:
+    """Turns a source address or interface name into a file name label."""
+    return re.sub(r"[^\w.-]", "_", source)
+
+
+def _source_available(source: str) -> bool:
+    """Returns True if a socket can be bound to the source address, or the interface exists."""
+    try:
+        address = ipaddress.ip_address(source)
+    except ValueError:
+        try:
+            socket.if_nametoindex(source)
+        except OSError:
+            return False
+        return True
+
+    family = socket.AF_INET if address.version == 4 else socket.AF_INET6
+    try:
+        with socket.socket(family, socket.SOCK_DGRAM) as sock:
+            sock.bind((source, 0))
+    except OSError:
+        return False
+    return True
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parses command-line arguments.
+
+    Parameters:
+    -----------
+    argv : Optional[List[str]], default=None
+        Arguments to parse (sys.argv[1:] if None)
+
+    Returns:
+    --------
+    argparse.Namespace
+        Parsed arguments; 'command' is None for a normal scan
+    """
+    parser = argparse.ArgumentParser(
+        description="Select the fastest IP addresses for Microsoft services."
+    )
+    parser.add_argument("--quiet", action="store_true", help="suppress all console output")
+    parser.add_argument("--node", help="node label written to measurement snapshots")
+    parser.add_argument("--site", help="site label written to measurement snapshots")
+    parser.add_argument(
+        "--export-snapshot", metavar="PATH", help="write a measurement snapshot after scanning"
+    )
+    parser.add_argument(
+        "--seed", metavar="PATH", help="probe only the top candidates of a merged snapshot"
+    )
+    parser.add_argument(
+        "--trace", metavar="PATH", help="write a Chrome/Perfetto trace of all probes"
+    )
+    parser.add_argument(
+        "--source",
+        action="append",
+        metavar="ADDR|IFACE",
+        help="probe from this source address or interface (repeat for several uplinks)",
+    )
+
+    subparsers = parser.add_subparsers(dest="command")
+    merge_parser = subparsers.add_parser(
+        "merge", help="merge measurement snapshots from many nodes into hosts files"
+    )
+    merge_parser.add_argument("snapshots", nargs="+", help="snapshot files to merge")
+    merge_parser.add_argument(
+        "--by-site", action="store_true", help="write one ranking and hosts file per site"
+    )
+    merge_parser.add_argument("--output", help="hosts file path (default: output_file setting)")
+    merge_parser.add_argument("--save", metavar="PATH", help="also write the merged snapshot")
+
+    subparsers.add_parser(
+        "batch", help="evaluate all 'profiles' from config.py in one run, sharing probes"
+    )
+
+    return parser.parse_args(argv)
+
+
+async def main(argv: Optional[List[str]] = None):
     """Main entry point for the Microsoft Hosts Picker application."""
+    args = parse_args(argv)
+    reporter = SilentLogger() if args.quiet else Logger()
+    # Only wait for the user when someone is at the terminal
+    interactive = sys.stdin.isatty() and not args.quiet
+
     try:
         # Load configuration
         config = DEFAULT_CONFIG.copy()
+        overrides = {
+            "node_name": args.node,
+            "site": args.site,
+            "snapshot_export": args.export_snapshot,
+            "seed_snapshot": args.seed,
+            "trace_file": args.trace,
+            "source_addresses": args.source,
+            "output_file": getattr(args, "output", None),
+        }
+        config.update({key: value for key, value in overrides.items() if value is not None})
 
         # Create and run the picker
-        picker = MicrosoftHostsPicker(config)
-        await picker.run()
+        picker = MicrosoftHostsPicker(config, reporter)
+        if args.command == "merge":
+            reporter.header("Microsoft Hosts Picker - Fleet Merge")
+            picker.merge_snapshots(args.snapshots, by_site=args.by_site, save_path=args.save)
+            return 0
+
+        if args.command == "batch":
+            if not config.get("profiles"):
+                reporter.error("No profiles configured; define 'profiles' in config.py")
+                return 1
+            results = await pick_profiles(config["profiles"], config, reporter)
+            ok = bool(results) and all(result.ok for result in results.values())
+        else:
+            ok = (await picker.run()).ok
+
+        if interactive:
+            input("\n🎯 Press Enter to exit...")
+        return 0 if ok else 1
 
     except KeyboardInterrupt:
-        Logger.warning("User cancelled operation")
+        reporter.warning("User cancelled operation")
+        return 130
     except Exception as e:
-        Logger.error(f"An unexpected error occurred: {e}")
-        print("Please check the configuration and try again")
-        input("Press Enter to exit...")
+        reporter.error(f"An unexpected error occurred: {e}")
+        reporter.info("Please check the configuration and try again")
+        if interactive:
+            input("Press Enter to exit...")
+        return 1
 
 
 def sync_main():
     """Synchronous entry point, starts the asynchronous main function."""
-    asyncio.run(main())
+    sys.exit(asyncio.run(main()))
 
 
 if __name__ == "__main__":
@@ -104,5 +104,45 @@ DEFAULT_CONFIG = {
     'ping_timeout': 0.5,  # ping超时时间
     'ping_max_workers': 100,  # 异步并发数量
     'good_enough_threshold': 50.0,  # 延迟阈值（毫秒）
-    'max_workers': None  # CPU核心数（None表示使用默认值）
+    'max_workers': None,  # CPU核心数（None表示使用默认值）
+    'dns_discovery': False,  # 是否通过DNS发现新的候选IP
+    'dns_resolvers': [  # DNS服务器（IPv4地址，可写作 host:port）
+        '223.5.5.5',
+        '119.29.29.29',
+        '114.114.114.114',
+        '8.8.8.8',
+        '1.1.1.1'
+    ],
+    'dns_ecs_subnets': [  # ECS客户端子网（None表示不携带ECS）
+        None,
+        '58.32.0.0/24',
+        '123.125.0.0/24',
+        '120.204.0.0/24',
+        '113.96.0.0/24'
+    ],
+    'dns_timeout': 2.0,  # DNS查询超时时间（秒）
+    'dns_socket_pool_size': 4,  # 用于流水线查询的UDP套接字数量
+    'dns_write_mode': 'sidecar',  # 'sidecar' 写入 *.discovered.txt，'inplace' 追加到原文件
+    'candidate_index_file': None,  # 编译后的候选IP索引（None表示 data_directory 下的 candidates.idx）
+    'shortlist_size': 5,  # 每个服务保留的最优候选IP数量（供后续阶段使用）
+    'node_name': None,  # 快照中的节点名称（None表示使用主机名）
+    'site': 'default',  # 快照中的站点名称
+    'snapshot_export': None,  # 测试完成后导出测量快照的路径
+    'seed_snapshot': None,  # 使用合并快照中的最优候选IP作为测试对象
+    'seed_top_n': 20,  # 每个服务从种子快照中选取的候选IP数量
+    'services': None,  # 需要测试的动态服务（None表示全部）
+    'profiles': [  # batch 命令一次运行的多个输出配置（共享同一批探测结果）
+        # Example of a profile that only picks Xbox hosts with a stricter threshold:
+        # {
+        #     'name': 'xbox',
+        #     'services': ['Xbox_Live_CDN_1', 'Xbox_Cloud_Sync', 'Microsoft_Games_Download'],
+        #     'good_enough_threshold': 30.0,
+        #     'output_file': 'hosts.xbox'
+        # }
+    ],
+    'trace_file': None,  # 导出每次探测各阶段耗时的 Chrome/Perfetto trace 文件路径
+    'trace_buffer_size': 200000,  # trace 环形缓冲区最多保留的记录数
+    # 同时从多个出口探测的源地址或网卡名（如 ['192.168.1.10', 'wlan0']），每个出口单独排名并生成
+    # hosts.<出口> 文件（为空表示只使用默认路由）
+    'source_addresses': []
 }
@@ -0,0 +1,75 @@
+"""Fixtures shared by the test modules."""
+
+import asyncio
+import os
+import sys
+
+import pytest
+
+from MicrosoftHostsPicker import AsyncPingTester, CandidateSet, MeasurementStore
+
+FAKE_PING = """#!{python}
+import sys
+args = sys.argv[1:]
+source = args[args.index("-I") + 1] if "-I" in args else None
+ip = args[-1]
+with open({log!r}, "a") as log:
+    log.write(f"{{source}} {{ip}}\\n")
+print(f"64 bytes from {{ip}}: icmp_seq=1 ttl=64 time={{ {latency!r}[source][ip] }} ms")
+"""
+
+
+class FakeTester(AsyncPingTester):
+    """Tester that answers from a table instead of running ping."""
+
+    def __init__(self, table, **kwargs):
+        super().__init__(**kwargs)
+        self.table = table
+        self.probed = []
+
+    async def probe_ip(self, ip):
+        self.probed.append(ip)
+        await asyncio.sleep(0)
+        return list(self.table[ip])
+
+
+def build_store(rtts_by_ip, attempts):
+    store = MeasurementStore.from_candidates(CandidateSet.from_ips(rtts_by_ip), attempts)
+    for row in range(len(store)):
+        rtts = rtts_by_ip[store.ip_at(row)]  # Rows hold IPv4 before IPv6
+        if rtts is not None:
+            store.record(row, rtts)
+    return store
+
+
+@pytest.fixture
+def make_store():
+    """Build a store from ``{ip: rtts}``, where ``None`` leaves the row unmeasured."""
+    return build_store
+
+
+@pytest.fixture
+def fake_tester():
+    """``FakeTester(table, **kwargs)``: a tester answering from ``{ip: rtts}``."""
+    return FakeTester
+
+
+@pytest.fixture
+def fake_ping(tmp_path, monkeypatch):
+    """Puts a ping on PATH that answers from ``{source: {ip: latency}}``.
+
+    The source is None for pings without ``-I``. Each call is logged as "source ip" to the
+    returned log path.
+    """
+
+    def install(latency):
+        bin_dir = tmp_path / "bin"
+        bin_dir.mkdir()
+        ping = bin_dir / "ping"
+        log = tmp_path / "ping.log"
+        ping.write_text(FAKE_PING.format(python=sys.executable, log=str(log), latency=latency))
+        ping.chmod(0o755)
+        monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+        return log
+
+    return install
@@ -0,0 +1,80 @@
+"""Tests for the compiled candidate index and packed candidate sets."""
+
+import os
+
+from MicrosoftHostsPicker import CandidateIndex, CandidateSet, ServiceConfig, discovered_file_path
+
+
+def make_services(tmp_path, **files):
+    services = {}
+    for key, content in files.items():
+        path = tmp_path / f"{key}.txt"
+        path.write_text(content)
+        services[key] = ServiceConfig(key, str(path), [f"{key}.example.com"])
+    return services
+
+
+def load(index, services):
+    index.load(services)
+    return {key: list(index.get(key)) for key in services}
+
+
+def test_index_reads_ipv4_then_ipv6_and_skips_invalid_lines(tmp_path):
+    services = make_services(
+        tmp_path, a="2001:db8::1\n10.0.0.1\n# comment\nnot-an-ip\n10.0.0.1\n::1\n"
+    )
+    index = CandidateIndex(str(tmp_path / "candidates.idx"))
+
+    assert load(index, services) == {"a": ["10.0.0.1", "2001:db8::1", "::1"]}
+
+
+def test_index_is_reused_while_files_are_unchanged(tmp_path):
+    services = make_services(tmp_path, a="10.0.0.1\n")
+    index_path = tmp_path / "candidates.idx"
+    index = CandidateIndex(str(index_path))
+    load(index, services)
+    built = index_path.stat().st_mtime_ns
+
+    load(CandidateIndex(str(index_path)), services)
+    assert index_path.stat().st_mtime_ns == built
+
+
+def test_index_rebuilds_when_a_file_mtime_changes(tmp_path):
+    services = make_services(tmp_path, a="10.0.0.1\n", b="10.0.1.1\n")
+    ip_file = tmp_path / "a.txt"
+    index = CandidateIndex(str(tmp_path / "candidates.idx"))
+    load(index, services)
+
+    # Same size, so only the mtime reveals the change
+    stat = ip_file.stat()
+    ip_file.write_text("10.0.0.2\n")
+    os.utime(ip_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+    assert load(index, services) == {"a": ["10.0.0.2"], "b": ["10.0.1.1"]}
+
+
+def test_index_rebuilds_when_a_sidecar_appears(tmp_path):
+    services = make_services(tmp_path, a="10.0.0.1\n")
+    index = CandidateIndex(str(tmp_path / "candidates.idx"))
+    load(index, services)
+
+    with open(discovered_file_path(services["a"].ip_file_path), "w") as file:
+        file.write("10.0.0.9\n10.0.0.1\n")
+
+    assert load(index, services) == {"a": ["10.0.0.1", "10.0.0.9"]}
+
+
+def test_unwritable_index_falls_back_to_memory(tmp_path):
+    services = make_services(tmp_path, a="10.0.0.1\n::1\n")
+    index = CandidateIndex(str(tmp_path / "missing" / "candidates.idx"))
+
+    assert load(index, services) == {"a": ["10.0.0.1", "::1"]}
+    assert not (tmp_path / "missing").exists()
+
+
+def test_candidate_set_keeps_address_family_when_sliced():
+    candidates = CandidateSet.from_ips(["::1", "1.2.3.4", "2001:db8::5", "5.6.7.8"])
+
+    assert len(candidates) == 4
+    assert list(candidates) == ["1.2.3.4", "5.6.7.8", "::1", "2001:db8::5"]
+    assert list(candidates[1:3]) == ["5.6.7.8", "::1"]
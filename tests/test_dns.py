@@ -0,0 +1,167 @@
+"""Tests for DNS candidate discovery, run against a stub DNS server on localhost."""
+
+import asyncio
+import socket
+import struct
+
+import pytest
+
+from MicrosoftHostsPicker import (
+    DnsCandidateDiscoverer,
+    ServiceConfig,
+    build_dns_query,
+    discovered_file_path,
+    parse_dns_response,
+    parse_resolver,
+)
+
+DNS_TYPE_CNAME = 5
+
+# A record the stub returns per client subnet (None: query without ECS option)
+STUB_ANSWERS = {None: "10.0.0.1", "58.32.0.0/24": "10.0.0.2", "123.125.0.0/24": "10.0.0.3"}
+
+
+def encode_name(name):
+    return b"".join(bytes([len(label)]) + label.encode() for label in name.split(".")) + b"\x00"
+
+
+def parse_query(data):
+    """Returns (transaction ID, domain, client subnet or None) of a query."""
+    txid, _, _, _, _, arcount = struct.unpack_from("!HHHHHH", data)
+    labels, offset = [], 12
+    while data[offset]:
+        length = data[offset]
+        labels.append(data[offset + 1 : offset + 1 + length].decode())
+        offset += length + 1
+    offset += 5  # Root label, QTYPE and QCLASS
+
+    subnet = None
+    if arcount:
+        offset += 11  # OPT record: root name, type, class, TTL and RDLENGTH
+        _, length, _, prefix, _ = struct.unpack_from("!HHHBB", data, offset)
+        address = data[offset + 8 : offset + 4 + length].ljust(4, b"\x00")
+        subnet = f"{socket.inet_ntoa(address)}/{prefix}"
+    return txid, ".".join(labels), subnet
+
+
+def build_response(query, ip, rcode=0):
+    """Answers a query with a CNAME to 'edge.example.net' and an A record for it."""
+    txid, domain, _ = parse_query(query)
+    question = encode_name(domain) + struct.pack("!HH", 1, 1)
+    header = struct.pack("!HHHHHH", txid, 0x8180 | rcode, 1, 0 if rcode else 2, 0, 0)
+    if rcode:
+        return header + question
+
+    target = encode_name("edge.example.net")
+    cname = b"\xc0\x0c" + struct.pack("!HHIH", DNS_TYPE_CNAME, 1, 60, len(target)) + target
+    a_record = target + struct.pack("!HHIH", 1, 1, 60, 4) + socket.inet_aton(ip)
+    return header + question + cname + a_record
+
+
+class StubDnsServer(asyncio.DatagramProtocol):
+    """Answers by client subnet; 'nx.example.com' gets NXDOMAIN, 'drop.example.com' nothing."""
+
+    def __init__(self):
+        self.queries = []
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        _, domain, subnet = parse_query(data)
+        self.queries.append((domain, subnet))
+        if domain == "drop.example.com":
+            return
+        rcode = 3 if domain == "nx.example.com" else 0
+        self.transport.sendto(build_response(data, STUB_ANSWERS[subnet], rcode), addr)
+
+
+async def resolve_with_stub(domains, ecs_subnets, timeout=1.0):
+    loop = asyncio.get_running_loop()
+    transport, server = await loop.create_datagram_endpoint(
+        StubDnsServer, local_addr=("127.0.0.1", 0)
+    )
+    try:
+        port = transport.get_extra_info("sockname")[1]
+        discoverer = DnsCandidateDiscoverer(
+            [f"127.0.0.1:{port}"], ecs_subnets, timeout=timeout, pool_size=2, retries=0
+        )
+        return await discoverer.resolve_domains(domains), server.queries
+    finally:
+        transport.close()
+
+
+def test_query_encodes_domain_and_client_subnet():
+    query = build_dns_query(0x1234, "login.live.com", "58.32.0.77/24")
+    assert parse_query(query) == (0x1234, "login.live.com", "58.32.0.0/24")
+    assert parse_query(build_dns_query(7, "login.live.com"))[2] is None
+
+
+def test_response_follows_cname_to_a_record():
+    query = build_dns_query(42, "www.example.com")
+    assert parse_dns_response(build_response(query, "10.9.8.7")) == (42, ["10.9.8.7"])
+
+
+def test_error_response_has_no_addresses():
+    query = build_dns_query(42, "nx.example.com")
+    assert parse_dns_response(build_response(query, "10.9.8.7", rcode=3)) == (42, [])
+
+
+def test_truncated_response_is_rejected():
+    query = build_dns_query(42, "www.example.com")
+    with pytest.raises(ValueError):
+        parse_dns_response(build_response(query, "10.9.8.7")[:-3])
+
+
+def test_resolver_must_be_ipv4():
+    assert parse_resolver("8.8.8.8") == ("8.8.8.8", 53)
+    assert parse_resolver("127.0.0.1:5353") == ("127.0.0.1", 5353)
+    for resolver in ("localhost:53", "::1", "1.2.3.4:0"):
+        with pytest.raises(ValueError):
+            parse_resolver(resolver)
+
+
+def test_resolve_against_stub_server_with_every_subnet():
+    subnets = [None, "58.32.0.0/24", "123.125.0.0/24"]
+    results, queries = asyncio.run(
+        resolve_with_stub(["a.example.com", "nx.example.com"], subnets)
+    )
+
+    assert results == {
+        "a.example.com": {"10.0.0.1", "10.0.0.2", "10.0.0.3"},
+        "nx.example.com": set(),
+    }
+    assert sorted(queries, key=str) == sorted(
+        [(domain, subnet) for domain in ("a.example.com", "nx.example.com") for subnet in subnets],
+        key=str,
+    )
+
+
+def test_unanswered_query_times_out_empty():
+    results, _ = asyncio.run(resolve_with_stub(["drop.example.com"], [None], timeout=0.2))
+    assert results == {"drop.example.com": set()}
+
+
+def test_discover_writes_new_ips_to_sidecar(tmp_path):
+    ip_file = tmp_path / "Service.txt"
+    ip_file.write_text("# comment\n10.0.0.1\n")
+    services = {"svc": ServiceConfig("Service", str(ip_file), ["a.example.com"])}
+
+    async def discover():
+        loop = asyncio.get_running_loop()
+        transport, _ = await loop.create_datagram_endpoint(
+            StubDnsServer, local_addr=("127.0.0.1", 0)
+        )
+        try:
+            port = transport.get_extra_info("sockname")[1]
+            discoverer = DnsCandidateDiscoverer(
+                [f"127.0.0.1:{port}"], [None, "58.32.0.0/24"], timeout=1.0
+            )
+            return await discoverer.discover(services)
+        finally:
+            transport.close()
+
+    assert asyncio.run(discover()) == {"svc": (1, 2)}
+    assert ip_file.read_text() == "# comment\n10.0.0.1\n"
+    with open(discovered_file_path(str(ip_file))) as file:
+        assert file.read() == "10.0.0.2\n"
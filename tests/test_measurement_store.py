@@ -0,0 +1,86 @@
+"""Tests for the columnar measurement store and the tester's use of it."""
+
+import asyncio
+
+import numpy as np
+import pytest
+
+from MicrosoftHostsPicker import CandidateSet, MeasurementStore
+
+INF = float("inf")
+
+
+def test_rank_orders_by_losses_then_latency_then_jitter(make_store):
+    store = make_store(
+        {
+            "10.0.0.1": [10, INF, 10],  # Fast but lossy
+            "10.0.0.2": [30, 30, 30],
+            "10.0.0.3": [20, 40, 30],  # Same mean as .2, more jitter
+            "10.0.0.4": [25, 25, 25],
+            "10.0.0.5": [INF, INF, INF],  # Unreachable
+            "10.0.0.6": None,  # Never probed
+        },
+        attempts=3,
+    )
+
+    assert [store.ip_at(row) for row in store.rank()] == [
+        "10.0.0.4",
+        "10.0.0.2",
+        "10.0.0.3",
+        "10.0.0.1",
+    ]
+    assert store.best() == ("10.0.0.4", 25.0)
+
+
+def test_top_k_matches_the_head_of_the_full_ranking():
+    rng = np.random.default_rng(1)
+    store = MeasurementStore(np.arange(1000, dtype=np.uint32), 4)
+    store.rtts[:] = rng.integers(5, 200, size=(1000, 4))
+    store.lost[:] = rng.random((1000, 4)) < 0.05
+    store.rtts[store.lost] = np.nan
+    store.measured[:900] = True
+
+    ranked = store.rank()
+    for k in (1, 5, 50, 2000):
+        assert store.top_k(k).tolist() == ranked[:k].tolist()
+    assert len(store.top_k(0)) == 0
+
+
+def test_percentile_matches_numpy_per_row(make_store):
+    rows = {"10.0.0.1": [10, 20, 40, 80], "10.0.0.2": [5, INF, 15, INF], "10.0.0.3": [7, 7, 7, 7]}
+    store = make_store(rows, attempts=4)
+
+    for q in (0, 25, 50, 90, 100):
+        received = [[rtt for rtt in rtts if rtt != INF] for rtts in rows.values()]
+        expected = [np.percentile(rtts, q) for rtts in received]
+        assert store.percentile(q) == pytest.approx(expected)
+
+
+def test_percentile_and_mean_are_inf_without_replies(make_store):
+    store = make_store({"10.0.0.1": [INF, INF]}, attempts=2)
+    assert store.percentile(50)[0] == INF
+    assert store.mean_latency()[0] == INF
+    assert store.best() == ("", INF)
+
+
+def test_find_best_ip_prefers_candidates_without_losses(fake_tester):
+    tester = fake_tester({"1.1.1.1": [10, INF], "2.2.2.2": [20, 20]}, attempts=2)
+    candidates = CandidateSet.from_ips(["1.1.1.1", "2.2.2.2"])
+    store = MeasurementStore.from_candidates(candidates, 2)
+
+    assert asyncio.run(tester.find_best_ip(candidates, store)) == ("2.2.2.2", 20.0)
+    assert store.best() == ("2.2.2.2", 20.0)
+
+
+def test_early_exit_still_fills_the_shortlist(fake_tester):
+    ips = [f"10.0.{i // 250}.{i % 250}" for i in range(500)]
+    table = {ip: [5.0 + i, 5.0 + i] for i, ip in enumerate(ips)}
+    candidates = CandidateSet.from_ips(ips)
+    tester = fake_tester(table, attempts=2, good_enough_threshold=50.0, min_results=5)
+    store = MeasurementStore.from_candidates(candidates, 2)
+
+    assert asyncio.run(tester.find_best_ip(candidates, store)) == ("10.0.0.0", 5.0)
+    # The 20% sample is enough, and every probe that finished was recorded
+    assert int(store.measured.sum()) == 100
+    assert [ip for ip, _ in store.shortlist(5)] == ips[:5]
+
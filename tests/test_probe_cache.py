@@ -0,0 +1,156 @@
+"""Tests for the shared probe layer and batch profile runs."""
+
+import asyncio
+import io
+
+import pytest
+
+from MicrosoftHostsPicker import (
+    DEFAULT_CONFIG,
+    Logger,
+    MicrosoftHostsPicker,
+    PickResult,
+    ProbeCache,
+    SilentLogger,
+    pick_profiles,
+)
+
+
+class SlowProbe:
+    """Probe factory that counts starts and waits until released."""
+
+    def __init__(self):
+        self.started = 0
+        self.cancelled = 0
+        self.release = None
+
+    def __call__(self):
+        self.started += 1
+        return self.run()
+
+    async def run(self):
+        try:
+            await self.release.wait()
+            return [1.0, 2.0]
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+
+
+def test_concurrent_requests_share_one_probe_and_reuse_its_result():
+    async def scenario():
+        cache, probe = ProbeCache(), SlowProbe()
+        probe.release = asyncio.Event()
+        waiters = [asyncio.ensure_future(cache.probe(("1.1.1.1",), probe)) for _ in range(3)]
+        await asyncio.sleep(0)
+        probe.release.set()
+        results = await asyncio.gather(*waiters)
+        return results, await cache.probe(("1.1.1.1",), probe), probe.started
+
+    results, reused, started = asyncio.run(scenario())
+    assert results == [[1.0, 2.0]] * 3
+    assert reused == [1.0, 2.0]
+    assert started == 1
+
+
+def test_cancelling_one_waiter_keeps_the_probe_for_the_others():
+    async def scenario():
+        cache, probe = ProbeCache(), SlowProbe()
+        probe.release = asyncio.Event()
+        first = asyncio.ensure_future(cache.probe(("1.1.1.1",), probe))
+        second = asyncio.ensure_future(cache.probe(("1.1.1.1",), probe))
+        await asyncio.sleep(0)
+
+        first.cancel()
+        await asyncio.sleep(0)
+        probe.release.set()
+        return first.cancelled(), await second, probe
+
+    first_cancelled, result, probe = asyncio.run(scenario())
+    assert first_cancelled
+    assert result == [1.0, 2.0]
+    assert (probe.started, probe.cancelled) == (1, 0)
+
+
+def test_cancelling_the_last_waiter_cancels_and_forgets_the_probe():
+    async def scenario():
+        cache, probe = ProbeCache(), SlowProbe()
+        probe.release = asyncio.Event()
+        waiter = asyncio.ensure_future(cache.probe(("1.1.1.1",), probe))
+        await asyncio.sleep(0)
+
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        await asyncio.sleep(0)
+        cancelled, remaining = probe.cancelled, len(cache)
+
+        # A later request starts a fresh probe
+        probe.release.set()
+        return cancelled, remaining, await cache.probe(("1.1.1.1",), probe), probe.started
+
+    cancelled, remaining, result, started = asyncio.run(scenario())
+    assert (cancelled, remaining) == (1, 0)
+    assert result == [1.0, 2.0]
+    assert started == 2
+
+
+def test_logger_prefixes_every_line():
+    stream = io.StringIO()
+    Logger(stream).with_prefix("[xbox] ").section("Testing")
+    assert stream.getvalue() == "\n[xbox] 📋 Testing\n[xbox] ───────────\n"
+
+
+def test_pick_reports_unexpected_errors_in_the_result(tmp_path, monkeypatch):
+    config = dict(DEFAULT_CONFIG, data_directory=str(tmp_path))
+    picker = MicrosoftHostsPicker(config, SilentLogger())
+
+    def fail():
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(picker, "validate_configuration", fail)
+    result = asyncio.run(picker.pick())
+    assert not result.ok
+    assert "boom" in result.error
+
+
+def test_failing_profile_does_not_discard_the_others(monkeypatch):
+    async def pick(self):
+        if self.config["profile_name"] == "bad":
+            raise RuntimeError("boom")
+        return PickResult(self.config["profile_name"], {}, "", None, 0.0)
+
+    monkeypatch.setattr(MicrosoftHostsPicker, "pick", pick)
+    profiles = [{"name": "good", "output_file": "hosts.good"}, {"name": "bad"}]
+    results = asyncio.run(pick_profiles(profiles, dict(DEFAULT_CONFIG), SilentLogger()))
+
+    assert results["good"].ok
+    assert not results["bad"].ok and "boom" in results["bad"].error
+
+
+def test_profiles_get_their_own_snapshot_paths(monkeypatch):
+    paths = {}
+
+    async def pick(self):
+        paths[self.config["profile_name"]] = self.config["snapshot_export"]
+        return PickResult(self.config["profile_name"], {}, "", None, 0.0)
+
+    monkeypatch.setattr(MicrosoftHostsPicker, "pick", pick)
+    config = dict(DEFAULT_CONFIG, snapshot_export="out/node.json.gz")
+    profiles = [
+        {"name": "a", "output_file": "hosts.a"},
+        {"name": "b", "output_file": "hosts.b"},
+        {"name": "c", "output_file": "hosts.c", "snapshot_export": "c.json.gz"},
+    ]
+    asyncio.run(pick_profiles(profiles, config, SilentLogger()))
+
+    assert paths == {"a": "out/node.a.json.gz", "b": "out/node.b.json.gz", "c": "c.json.gz"}
+
+
+def test_profiles_must_not_share_a_snapshot_path():
+    profiles = [
+        {"name": "a", "output_file": "hosts.a", "snapshot_export": "same.json.gz"},
+        {"name": "b", "output_file": "hosts.b", "snapshot_export": "same.json.gz"},
+    ]
+    with pytest.raises(ValueError):
+        asyncio.run(pick_profiles(profiles, dict(DEFAULT_CONFIG), SilentLogger()))
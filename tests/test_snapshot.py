@@ -0,0 +1,78 @@
+"""Tests for measurement snapshots: export, save/load and fleet merges."""
+
+import asyncio
+
+import pytest
+
+from MicrosoftHostsPicker import CandidateSet, MeasurementSnapshot, MeasurementStore
+
+INF = float("inf")
+
+
+@pytest.fixture
+def make_snapshot(make_store):
+    def make(node, site, rtts_by_ip):
+        return MeasurementSnapshot.from_stores(node, site, {"svc": make_store(rtts_by_ip, 2)})
+
+    return make
+
+
+def test_snapshot_holds_only_measured_rows(make_snapshot):
+    snapshot = make_snapshot(
+        "n1", "sh", {"::1": [5, INF], "10.0.0.1": [10, 20], "10.0.0.2": None}
+    )
+    columns = snapshot.services["svc"]
+
+    assert columns["ips"].tolist() == ["10.0.0.1", "::1"]
+    assert columns["sent"].tolist() == [2, 2]
+    assert columns["received"].tolist() == [2, 1]
+    assert columns["mean"].tolist() == [15.0, 5.0]
+
+
+def test_save_and_load_round_trip(tmp_path, make_snapshot):
+    snapshot = make_snapshot("n1", "sh", {"10.0.0.1": [10, 20], "10.0.0.2": [INF, INF]})
+    path = tmp_path / "n1.json.gz"
+    snapshot.save(str(path))
+    loaded = MeasurementSnapshot.load(str(path))
+
+    assert (loaded.node, loaded.site, loaded.timestamp) == ("n1", "sh", snapshot.timestamp)
+    assert loaded.rank("svc") == snapshot.rank("svc") == [("10.0.0.1", 15.0)]
+    assert loaded.services["svc"]["mean"].tolist() == [15.0, INF]
+
+
+def test_load_rejects_other_files(tmp_path):
+    path = tmp_path / "hosts"
+    path.write_text("127.0.0.1 localhost\n")
+    with pytest.raises(ValueError):
+        MeasurementSnapshot.load(str(path))
+
+
+def test_merge_pools_attempts_and_weights_latency_by_replies(tmp_path, make_snapshot):
+    first = make_snapshot("n1", "sh", {"10.0.0.1": [10, 10], "10.0.0.2": [50, INF]})
+    second = make_snapshot("n2", "sh", {"10.0.0.1": [40, INF], "10.0.0.3": [30, 30]})
+    for snapshot in (first, second):
+        snapshot.save(str(tmp_path / f"{snapshot.node}.json.gz"))
+
+    loaded = [MeasurementSnapshot.load(str(tmp_path / f"{node}.json.gz")) for node in ("n1", "n2")]
+    merged = MeasurementSnapshot.merge(loaded, site="sh")
+    merged.save(str(tmp_path / "merged.json.gz"))
+    merged = MeasurementSnapshot.load(str(tmp_path / "merged.json.gz"))
+
+    columns = merged.services["svc"]
+    assert columns["ips"].tolist() == ["10.0.0.1", "10.0.0.2", "10.0.0.3"]
+    assert columns["sent"].tolist() == [4, 2, 2]
+    assert columns["received"].tolist() == [3, 1, 2]
+    assert columns["mean"].tolist() == pytest.approx([20.0, 50.0, 30.0])
+    # Pooled loss ranks the lossless .3 first, then .1 (1/4 lost) before .2 (1/2 lost)
+    assert [ip for ip, _ in merged.rank("svc")] == ["10.0.0.3", "10.0.0.1", "10.0.0.2"]
+
+
+def test_exporting_tester_measures_every_candidate(fake_tester):
+    ips = [f"10.0.0.{i}" for i in range(60)]
+    tester = fake_tester({ip: [1.0, 1.0] for ip in ips}, attempts=2, early_exit=False)
+    candidates = CandidateSet.from_ips(ips)
+    store = MeasurementStore.from_candidates(candidates, 2)
+    asyncio.run(tester.find_best_ip(candidates, store))
+
+    snapshot = MeasurementSnapshot.from_stores("n1", "sh", {"svc": store})
+    assert len(snapshot.services["svc"]["ips"]) == 60
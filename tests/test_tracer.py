@@ -0,0 +1,175 @@
+"""Tests for the probe tracer and the Chrome trace it writes."""
+
+import asyncio
+import json
+import sys
+import types
+
+import pytest
+
+import MicrosoftHostsPicker as picker_module
+from MicrosoftHostsPicker import DEFAULT_CONFIG, MicrosoftHostsPicker, ProbeTracer, SilentLogger
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Replaces the tracer's clock; append nanosecond readings to the returned list."""
+    ticks = []
+    monkeypatch.setattr(picker_module, "time", types.SimpleNamespace(perf_counter_ns=ticks.pop))
+    return ticks
+
+
+def set_ticks(clock, *ticks):
+    clock[:] = reversed(ticks)
+
+
+def write(tracer, tmp_path):
+    path = tmp_path / "trace.json"
+    spans = tracer.write(str(path))
+    with open(path) as file:
+        events = json.load(file)["traceEvents"]
+    assert spans == sum(event["ph"] == "X" for event in events)
+    return events
+
+
+def spans(events):
+    return [event for event in events if event["ph"] == "X"]
+
+
+def test_ring_buffer_keeps_the_newest_spans(tmp_path):
+    tracer = ProbeTracer(capacity=3)
+    for i in range(5):
+        with tracer.span(f"s{i}", "probe"):
+            pass
+
+    assert len(tracer) == 3
+    assert [event["name"] for event in spans(write(tracer, tmp_path))] == ["s2", "s3", "s4"]
+
+
+def test_groups_share_a_lane_only_when_they_do_not_overlap(clock, tmp_path):
+    # g1: 0-40 (with a phase at 10-20), g2: 5-60, g3: 45-70, g4: 65-80
+    set_ticks(clock, 0, 0, 5, 10, 20, 40, 45, 60, 65, 70, 80)
+    tracer = ProbeTracer()
+    g1, g2, g3, g4, phase = (
+        tracer.span(name, "probe", group)
+        for name, group in [("g1", 1), ("g2", 2), ("g3", 3), ("g4", 4), ("g1 phase", 1)]
+    )
+    for span, method in [
+        (g1, "__enter__"),
+        (g2, "__enter__"),
+        (phase, "__enter__"),
+        (phase, "__exit__"),
+        (g1, "__exit__"),
+        (g3, "__enter__"),
+        (g2, "__exit__"),
+        (g4, "__enter__"),
+        (g3, "__exit__"),
+        (g4, "__exit__"),
+    ]:
+        getattr(span, method)(*([None] * 3 if method == "__exit__" else []))
+
+    events = spans(write(tracer, tmp_path))
+    lanes = {event["name"]: event["tid"] for event in events}
+    assert lanes == {"g1": 1, "g1 phase": 1, "g2": 2, "g3": 1, "g4": 2}
+
+    # Groups sharing a lane never overlap
+    extents = {}
+    for event in events:
+        group = event["name"].split()[0]
+        start, end = extents.get(group, (event["ts"], event["ts"] + event["dur"]))
+        extents[group] = (min(start, event["ts"]), max(end, event["ts"] + event["dur"]))
+    for lane in set(lanes.values()):
+        on_lane = sorted(extent for group, extent in extents.items() if lanes[group] == lane)
+        assert all(before[1] <= after[0] for before, after in zip(on_lane, on_lane[1:]))
+
+
+def test_metadata_names_each_category_and_lane(tmp_path):
+    tracer = ProbeTracer()
+    with tracer.span("Office CDN", "service", tracer.new_group()):
+        with tracer.span("ping 10.0.0.1", "probe", tracer.new_group()):
+            with tracer.span("ping 10.0.0.2", "probe", tracer.new_group()):
+                pass
+
+    events = write(tracer, tmp_path)
+    processes = {
+        event["pid"]: event["args"]["name"] for event in events if event["name"] == "process_name"
+    }
+    threads = {
+        (processes[event["pid"]], event["tid"]): event["args"]["name"]
+        for event in events
+        if event["name"] == "thread_name"
+    }
+    assert sorted(processes.values()) == ["probe", "service"]
+    assert threads == {
+        ("service", 1): "service lane 1",
+        ("probe", 1): "probe lane 1",
+        ("probe", 2): "probe lane 2",
+    }
+    # Metadata comes before the spans it names
+    assert all(event["ph"] == "M" for event in events[: len(processes) + len(threads)])
+
+
+def test_parents_are_written_before_children_that_start_together(clock, tmp_path):
+    set_ticks(clock, 0, 100, 100, 150, 200)
+    tracer = ProbeTracer()
+    with tracer.span("parent", "probe", 1):
+        with tracer.span("child", "probe", 1):
+            pass
+
+    events = spans(write(tracer, tmp_path))
+    assert [(event["name"], event["ts"], event["dur"]) for event in events] == [
+        ("parent", 0.1, 0.1),
+        ("child", 0.1, 0.05),
+    ]
+
+
+@pytest.mark.parametrize("error", [TimeoutError, asyncio.CancelledError])
+def test_spans_exited_by_an_error_are_tagged(error, tmp_path):
+    tracer = ProbeTracer()
+    with pytest.raises(error):
+        with tracer.span("wait", "probe", 1, {"ip": "10.0.0.1"}):
+            raise error()
+
+    (event,) = spans(write(tracer, tmp_path))
+    assert event["args"] == {"ip": "10.0.0.1", "error": error.__name__}
+
+
+def test_disabled_tracer_records_nothing(tmp_path):
+    tracer = ProbeTracer(enabled=False)
+    with tracer.span("ping 10.0.0.1", "probe", tracer.new_group()):
+        pass
+
+    assert len(tracer) == 0
+    assert write(tracer, tmp_path) == []
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="needs a POSIX ping replacement")
+def test_pick_traces_every_phase_of_each_ping(tmp_path, monkeypatch, fake_ping):
+    latency = {"127.0.0.10": 5.0, "127.0.0.11": 30.0}
+    fake_ping({None: latency})
+    (tmp_path / "data").mkdir()
+    (tmp_path / "data" / "Office_CDN.txt").write_text("\n".join(latency) + "\n")
+    monkeypatch.chdir(tmp_path)
+
+    config = dict(DEFAULT_CONFIG, services=["Office_CDN"], trace_file="trace.json")
+    assert asyncio.run(MicrosoftHostsPicker(config, SilentLogger()).pick()).ok
+
+    with open(tmp_path / "trace.json") as file:
+        events = spans(json.load(file)["traceEvents"])
+    assert [event["cat"] for event in events].count("service") == 1
+
+    attempts = DEFAULT_CONFIG.get("ping_attempts", 2)
+    for ip in latency:
+        (ping,) = [event for event in events if event["name"] == f"ping {ip}"]
+        assert ping["args"]["ip"] == ip
+        end = ping["ts"] + ping["dur"]
+        phases = [
+            event["name"]
+            for event in events
+            if event is not ping
+            and (event["pid"], event["tid"]) == (ping["pid"], ping["tid"])
+            and ping["ts"] <= event["ts"] <= end
+        ]
+        assert phases.count("semaphore_wait") == 1
+        for phase in ("spawn", "wait", "parse"):
+            assert phases.count(phase) == attempts
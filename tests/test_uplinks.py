@@ -0,0 +1,101 @@
+"""Tests for multi-uplink probing, using loopback addresses as uplinks and a fake ping."""
+
+import asyncio
+import sys
+
+import pytest
+
+from MicrosoftHostsPicker import (
+    DEFAULT_CONFIG,
+    MeasurementSnapshot,
+    MicrosoftHostsPicker,
+    SilentLogger,
+    _source_available,
+    main,
+)
+
+pytestmark = [
+    pytest.mark.skipif(sys.platform == "win32", reason="needs a POSIX ping replacement"),
+    pytest.mark.skipif(
+        not _source_available("127.0.0.2"), reason="127.0.0.2 is not a local address"
+    ),
+]
+
+# Latency (milliseconds) per uplink and candidate: each uplink has a different winner
+LATENCY = {
+    "127.0.0.2": {"127.0.0.10": 5.0, "127.0.0.11": 30.0},
+    "127.0.0.3": {"127.0.0.10": 40.0, "127.0.0.11": 8.0},
+}
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch, fake_ping):
+    """Working directory with one service's candidates and a fake ping on PATH."""
+    fake_ping(LATENCY)
+    (tmp_path / "data").mkdir()
+    (tmp_path / "data" / "Office_CDN.txt").write_text("127.0.0.10\n127.0.0.11\n")
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def read_hosts(path):
+    with open(path) as file:
+        return {
+            line.split()[1]: line.split()[0]
+            for line in file
+            if line.strip() and not line.startswith("#")
+        }
+
+
+def test_source_flag_writes_a_ranked_hosts_file_per_uplink(workdir):
+    argv = ["--quiet", "--source", "127.0.0.2", "--source", "127.0.0.3"]
+    assert asyncio.run(main(argv)) == 0
+
+    domain = "officecdn.microsoft.com"
+    assert read_hosts(workdir / "hosts.127.0.0.2")[domain] == "127.0.0.10"
+    assert read_hosts(workdir / "hosts.127.0.0.3")[domain] == "127.0.0.11"
+    assert read_hosts(workdir / "hosts")[domain] == "127.0.0.10"
+
+    # Every candidate was probed once per attempt from every uplink
+    probes = (workdir / "ping.log").read_text().split("\n")[:-1]
+    attempts = DEFAULT_CONFIG.get("ping_attempts", 2)
+    assert sorted(probes) == sorted(
+        f"{source} {ip}" for source in LATENCY for ip in LATENCY[source] for _ in range(attempts)
+    )
+
+
+def test_pick_returns_per_uplink_results_and_snapshots(workdir):
+    config = dict(
+        DEFAULT_CONFIG,
+        source_addresses=["127.0.0.2", "127.0.0.3"],
+        services=["Office_CDN"],
+        node_name="gw-01",
+        snapshot_export="snap.json.gz",
+    )
+    picker = MicrosoftHostsPicker(config, SilentLogger())
+    result = asyncio.run(picker.pick())
+
+    assert result.ok
+    assert result.services["Office_CDN"].ip == "127.0.0.10"
+    assert {
+        source: (services["Office_CDN"].ip, [ip for ip, _ in services["Office_CDN"].shortlist])
+        for source, services in result.uplinks.items()
+    } == {
+        "127.0.0.2": ("127.0.0.10", ["127.0.0.10", "127.0.0.11"]),
+        "127.0.0.3": ("127.0.0.11", ["127.0.0.11", "127.0.0.10"]),
+    }
+
+    # One semaphore bounds the pings of all uplinks
+    semaphores = {id(tester.semaphore) for tester in picker.uplink_testers.values()}
+    assert semaphores == {id(picker.ping_tester.semaphore)}
+
+    for source in LATENCY:
+        snapshot = MeasurementSnapshot.load(str(workdir / f"snap.{source}.json.gz"))
+        assert snapshot.node == f"gw-01@{source}"
+        assert snapshot.rank("Office_CDN")[0][0] == picker.uplink_results[source]["Office_CDN"][0]
+    assert not (workdir / "snap.json.gz").exists()
+
+
+def test_unknown_uplink_fails_validation(workdir):
+    assert asyncio.run(main(["--quiet", "--source", "no-such-if0"])) == 1
+    assert not (workdir / "ping.log").exists()